@@ -0,0 +1,103 @@
+import threading
+import time
+
+import numpy as np
+
+# Answer cache settings
+ANSWER_CACHE_THRESHOLD = 0.95
+ANSWER_CACHE_MAX_ENTRIES = 500
+ANSWER_CACHE_TTL_SECONDS = 24 * 3600
+
+
+class SemanticAnswerCache:
+    """Cache of finished chatbot answers, looked up by question similarity.
+
+    A new question reuses a stored answer when its embedding has a cosine
+    similarity of at least `threshold` with a cached question asked with the
+    same language and answer options. Every entry belongs to the corpus
+    version it was answered from, and a new corpus hash empties the cache.
+    """
+
+    def __init__(self, threshold=ANSWER_CACHE_THRESHOLD, max_entries=ANSWER_CACHE_MAX_ENTRIES,
+                 ttl_seconds=ANSWER_CACHE_TTL_SECONDS):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.corpus_hash = None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._vectors = None  # one normalized question embedding per row
+        self._entries = []
+
+    def _check_corpus(self, corpus_hash):
+        if corpus_hash != self.corpus_hash:
+            self.corpus_hash = corpus_hash
+            self._vectors = None
+            self._entries = []
+
+    def lookup(self, embedding, language_option, answer_option, corpus_hash):
+        """Return the closest matching entry (a dict with 'chunks' and 'sources'), or None."""
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        now = time.time()
+        with self._lock:
+            self._check_corpus(corpus_hash)
+            if self._vectors is not None:
+                scores = self._vectors @ query
+                for i in np.argsort(-scores):
+                    if scores[i] < self.threshold:
+                        break
+                    entry = self._entries[i]
+                    if (entry["language_option"] == language_option
+                            and entry["answer_option"] == answer_option
+                            and now - entry["created_at"] <= self.ttl_seconds):
+                        entry["last_used"] = now
+                        self.hits += 1
+                        return entry
+            self.misses += 1
+            return None
+
+    def store(self, embedding, language_option, answer_option, corpus_hash, chunks, sources):
+        """Remember the streamed chunks and sources of a finished answer."""
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+        now = time.time()
+        entry = {
+            "language_option": language_option,
+            "answer_option": answer_option,
+            "chunks": list(chunks),
+            "sources": list(sources),
+            "created_at": now,
+            "last_used": now,
+        }
+        with self._lock:
+            self._check_corpus(corpus_hash)
+            self._entries.append(entry)
+            vectors = [vector[np.newaxis, :]]
+            if self._vectors is not None:
+                vectors.insert(0, self._vectors)
+            self._vectors = np.concatenate(vectors)
+
+            # Evict expired entries, then the least recently used ones
+            keep = [i for i, e in enumerate(self._entries) if now - e["created_at"] <= self.ttl_seconds]
+            if len(keep) > self.max_entries:
+                keep = sorted(sorted(keep, key=lambda i: self._entries[i]["last_used"])[-self.max_entries:])
+            if len(keep) < len(self._entries):
+                self._entries = [self._entries[i] for i in keep]
+                self._vectors = self._vectors[keep]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+# Function to replay a cached answer through the same streaming loop as a live one
+def replay_answer(chunks):
+    for chunk in chunks:
+        yield chunk
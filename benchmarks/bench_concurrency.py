@@ -0,0 +1,144 @@
+"""Load test: many chats at once against the local mock OpenAI server.
+
+Simulates N sessions asking a question at the same moment (N = 10, 50, 100)
+and streams every answer to the end. Two serving paths are compared:
+
+  sync   the old path: each session thread makes a blocking streaming call
+         with the synchronous SDK client
+  async  the providers path: the request runs as a coroutine on the shared
+         event loop, limited by the provider's semaphore (--max-concurrency);
+         each session thread still blocks reading its TokenStream
+
+Reports p50/p99 time to first token and to the full answer, and the most
+threads alive during the run.
+
+    python benchmarks/bench_concurrency.py --concurrency 10 50 100 --ttft 0.3 --token-delay 0.02
+"""
+import argparse
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from mock_openai_server import start_server_process
+
+MESSAGES = [
+    {"role": "system", "content": "You are a supportive assistant for Summer Residential Counselors."},
+    {"role": "user", "content": "What time is curfew on weekends?"},
+]
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+def sync_chat(client, tokens):
+    stream = client.chat.completions.create(model="gpt-4o", messages=MESSAGES, max_tokens=tokens, stream=True)
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+def async_chat(provider, tokens):
+    return provider.stream(MESSAGES, model="gpt-4o", max_tokens=tokens)
+
+# Function to run n chats at the same moment and time each one
+def run_sessions(chat, n):
+    barrier = threading.Barrier(n + 1)
+    results = [None] * n
+    peak_threads = [threading.active_count()]
+
+    def session(i):
+        barrier.wait()
+        started = time.perf_counter()
+        first = None
+        try:
+            for _ in chat():
+                if first is None:
+                    first = time.perf_counter() - started
+            results[i] = (first, time.perf_counter() - started, None)
+        except Exception as e:
+            results[i] = (None, time.perf_counter() - started, e)
+
+    threads = [threading.Thread(target=session, args=(i,), daemon=True) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    while any(thread.is_alive() for thread in threads):
+        peak_threads[0] = max(peak_threads[0], threading.active_count())
+        time.sleep(0.01)
+    wall = time.perf_counter() - started
+    errors = [error for _, _, error in results if error is not None]
+    ttfts = [first for first, _, error in results if error is None and first is not None]
+    totals = [total for _, total, error in results if error is None]
+    return {"wall": wall, "ttfts": ttfts, "totals": totals, "errors": errors, "threads": peak_threads[0]}
+
+def run(args, base_url):
+    from openai import OpenAI
+    import providers
+
+    sync_client = OpenAI(api_key="mock", base_url=base_url, max_retries=0)
+    provider = providers.get_provider("openai", "mock")
+    if args.max_concurrency:
+        provider.max_concurrency = args.max_concurrency
+    paths = [
+        ("sync", lambda: sync_chat(sync_client, args.tokens)),
+        ("async", lambda: async_chat(provider, args.tokens)),
+    ]
+
+    # One request per path first, so connection setup is not measured
+    for _, chat in paths:
+        list(chat())
+
+    print(f"mock: first token after {args.ttft}s, {args.tokens} tokens {args.token_delay}s apart; "
+          f"async limit {provider.max_concurrency} streams")
+    print(f"{'chats':>5} {'path':<6} {'ttft p50':>9} {'ttft p99':>9} {'total p50':>10} {'total p99':>10} "
+          f"{'wall':>7} {'threads':>8} {'errors':>7}")
+    for n in args.concurrency:
+        for name, chat in paths:
+            result = run_sessions(chat, n)
+            if not result["totals"]:
+                print(f"{n:>5} {name:<6} all {n} chats failed: {result['errors'][0]}")
+                continue
+            print(f"{n:>5} {name:<6} {percentile(result['ttfts'], 50):9.3f} {percentile(result['ttfts'], 99):9.3f} "
+                  f"{percentile(result['totals'], 50):10.3f} {percentile(result['totals'], 99):10.3f} "
+                  f"{result['wall']:7.2f} {result['threads']:8d} {len(result['errors']):7d}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 50, 100])
+    parser.add_argument("--ttft", type=float, default=0.3, help="mock seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="mock seconds between tokens")
+    parser.add_argument("--tokens", type=int, default=100, help="tokens per answer")
+    parser.add_argument("--max-concurrency", type=int, default=None,
+                        help="streams allowed at once on the async path (default: providers.MAX_CONCURRENT_STREAMS)")
+    parser.add_argument("--base-url", help="use an already running OpenAI-compatible server")
+    args = parser.parse_args()
+
+    process = None
+    if args.base_url:
+        base_url = args.base_url
+    else:
+        process, base_url = start_server_process(ttft=args.ttft, token_delay=args.token_delay, tokens=args.tokens)
+    os.environ["OPENAI_BASE_URL"] = base_url
+
+    # Run in a scratch directory so the provider calls do not land in the app's token ledger
+    original_directory = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            os.chdir(workdir)
+            run(args, base_url)
+    finally:
+        os.chdir(original_directory)
+        if process is not None:
+            process.terminate()
+
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Benchmark HTML-to-text extraction over saved pages in benchmarks/fixtures.
+
+Compares the extractors cps2/cps3 used before html_extract existed
+(BeautifulSoup with html.parser, all text or <p> text) with html_extract
+on every installed parser. Reports the median parse time per page and the
+GPT-4o token count of the output, i.e. what the page costs in a prompt.
+
+    python benchmarks/bench_html_extract.py --repeat 50
+"""
+import argparse
+import glob
+import os
+import statistics
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from bs4 import BeautifulSoup
+
+import html_extract
+from chat_memory import get_chat_encoding
+
+
+# The extraction code cps2 and cps3 used before html_extract existed
+def legacy_page(html):
+    return BeautifulSoup(html, "html.parser").get_text()
+
+def legacy_paragraphs(html):
+    soup = BeautifulSoup(html, "html.parser")
+    return " ".join([p.get_text() for p in soup.find_all("p")])
+
+def timed(function, pages, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for html in pages:
+            function(html)
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000 / len(pages)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures-dir", default=os.path.join(REPO_ROOT, "benchmarks", "fixtures"))
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.fixtures_dir, "*.html")))
+    if not paths:
+        sys.exit(f"No .html fixtures in {args.fixtures_dir}")
+    pages = []
+    for path in paths:
+        with open(path, "rb") as file:
+            pages.append(file.read())
+    encoding = get_chat_encoding()
+
+    candidates = [
+        ("page: BeautifulSoup get_text (old cps2)", legacy_page),
+        ("paragraphs: BeautifulSoup <p> (old cps3)", legacy_paragraphs),
+    ]
+    for name in html_extract.available_parsers():
+        for mode in ("text", "paragraphs"):
+            label = "page" if mode == "text" else "paragraphs"
+            candidates.append((f"{label}: html_extract {name}",
+                               lambda html, mode=mode, name=name: html_extract.extract(html, mode, parser=name)))
+
+    total_bytes = sum(len(html) for html in pages)
+    print(f"{len(pages)} page(s), {total_bytes / 1024:.0f} KiB of HTML, median of {args.repeat} runs")
+    print(f"{'extractor':<44} {'ms/page':>9} {'tokens':>8}")
+    for name, function in sorted(candidates, key=lambda candidate: candidate[0]):
+        milliseconds = timed(function, pages, args.repeat)
+        tokens = sum(len(encoding.encode(function(html))) for html in pages)
+        print(f"{name:<44} {milliseconds:9.2f} {tokens:8d}")
+
+
+if __name__ == "__main__":
+    main()
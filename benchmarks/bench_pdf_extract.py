@@ -0,0 +1,87 @@
+"""Benchmark PDF text extraction over Lab4_datafiles.
+
+Compares the old ingestion path (PyPDF2, one page after another) with
+PyMuPDF sequentially, PyMuPDF across the process pool, and a warm
+on-disk cache hit. The handbooks are short, so --copies can stitch each
+PDF into a longer document to show how the process pool scales.
+
+    python benchmarks/bench_pdf_extract.py --copies 20 --repeat 3
+"""
+import argparse
+import glob
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import fitz  # PyMuPDF
+from PyPDF2 import PdfReader
+
+import pdf_extract
+
+
+# The extraction code cps4/cps5 used before pdf_extract existed
+def legacy_pypdf2(filepath):
+    with open(filepath, "rb") as file:
+        pdf_reader = PdfReader(file)
+        return ''.join([page.extract_text() or '' for page in pdf_reader.pages])
+
+def stitch(filepath, copies, directory):
+    output = fitz.open()
+    with fitz.open(filepath) as source:
+        for _ in range(copies):
+            output.insert_pdf(source)
+    path = os.path.join(directory, f"x{copies}-" + os.path.basename(filepath))
+    output.save(path)
+    return path
+
+def timed(function, paths, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for path in paths:
+            function(path)
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default=os.path.join(REPO_ROOT, "Lab4_datafiles"))
+    parser.add_argument("--copies", type=int, default=1, help="repeat each PDF this many times")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = sorted(glob.glob(os.path.join(args.data_dir, "*.pdf")))
+        if args.copies > 1:
+            paths = [stitch(path, args.copies, directory) for path in paths]
+        pages = sum(fitz.open(path).page_count for path in paths)
+        cache_dir = os.path.join(directory, "cache")
+
+        # Start the worker processes before timing so pool start-up is not counted
+        pdf_extract._get_pool().submit(int).result()
+
+        results = [
+            ("PyPDF2 sequential (old path)", timed(legacy_pypdf2, paths, args.repeat)),
+            ("PyMuPDF sequential", timed(
+                lambda path: pdf_extract.extract_pages_uncached(path, "pymupdf", workers=1), paths, args.repeat)),
+            (f"PyMuPDF process pool ({pdf_extract.MAX_WORKERS} workers)", timed(
+                lambda path: pdf_extract.extract_pages_uncached(path, "pymupdf"), paths, args.repeat)),
+        ]
+        for path in paths:
+            pdf_extract.extract_pages(path, "pymupdf", cache_dir=cache_dir)
+        results.append(("Disk cache hit", timed(
+            lambda path: pdf_extract.extract_pages(path, "pymupdf", cache_dir=cache_dir), paths, args.repeat)))
+
+    print(f"{len(paths)} file(s), {pages} pages, median of {args.repeat} runs")
+    baseline = results[0][1]
+    for name, milliseconds in results:
+        print(f"{name:<38} {milliseconds:10.1f} ms   {baseline / milliseconds:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""Offline benchmark of the cps5 RAG pipeline, stage by stage.
+
+Runs the real code against the local mock OpenAI server (deterministic
+embeddings, streamed answers with configurable latency), so no API key is
+needed:
+
+  extract   PDF text extraction (pdf_extract, no cache)
+  chunk     token chunking (ingestion.chunk_pages)
+  ingest    sync_pdf_directory into a fresh vector store: extract, chunk, embed, store
+  lexical   BM25 index build over the stored chunks
+  retrieve  query embedding + hybrid search, as in cps5.query_vector_db
+  assemble  assemble_context + cps5.build_chatbot_messages
+  answer    streaming the answer through the OpenAI provider
+
+For each stage it reports wall time (per item p50/p95 where the stage runs
+per question), peak Python memory from tracemalloc, and the tokens in each
+prompt. Results are saved as JSON; --compare prints the change against an
+earlier results file.
+
+    python benchmarks/bench_rag.py --backend numpy --output benchmarks/results/rag.json
+    python benchmarks/bench_rag.py --compare benchmarks/results/rag.json
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from mock_openai_server import start_server_process
+
+QUESTIONS = [
+    "What time is curfew for residential students?",
+    "What should a counselor do if a student is missing at check-in?",
+    "Are students allowed to leave campus on weekends?",
+    "How do I report a medical emergency?",
+    "What are the rules about guests in the residence halls?",
+    "What are the responsibilities of a Summer Residential Counselor?",
+    "Can students have cars on campus?",
+    "What happens if a student violates the alcohol policy?",
+]
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class Stage:
+    """Times one stage and, when enabled, records its peak traced memory."""
+
+    def __init__(self, results, name, trace_memory):
+        self.results = results
+        self.name = name
+        self.trace_memory = trace_memory
+        self.samples = []
+        self.extra = {}
+
+    def __enter__(self):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            self.memory_before = tracemalloc.get_traced_memory()[0]
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.started
+        result = {"seconds": seconds}
+        if self.samples:
+            result.update(items=len(self.samples), p50=percentile(self.samples, 50), p95=percentile(self.samples, 95))
+        if self.trace_memory:
+            result["peak_memory_mb"] = (tracemalloc.get_traced_memory()[1] - self.memory_before) / (1024 * 1024)
+        result.update(self.extra)
+        self.results[self.name] = result
+
+    def timed(self, function, *args, **kwargs):
+        started = time.perf_counter()
+        value = function(*args, **kwargs)
+        self.samples.append(time.perf_counter() - started)
+        return value
+
+
+def run_pipeline(args, base_url, workdir):
+    # Imported here, after chdir, so the repo's caches (.pdf_text_cache etc.) land in workdir
+    from openai import OpenAI
+
+    import cps5
+    import pdf_extract
+    import providers
+    from chat_memory import get_chat_encoding
+    from context import assemble_context
+    from embeddings import embed_query
+    from ingestion import MANIFEST_FILENAME, chunk_pages, describe_source, sync_pdf_directory
+    from lexical import HybridRetriever, build_lexical_index
+    from retrievers import ChromaRetriever, NumpyVectorStore
+
+    client = OpenAI(api_key="mock", base_url=base_url)
+    provider = providers.get_provider("openai", "mock")
+    encoding = get_chat_encoding()
+    paths = sorted(glob.glob(os.path.join(args.data_dir, "*.pdf")))
+    if not paths:
+        sys.exit(f"No PDFs in {args.data_dir}")
+    results = {}
+    trace = not args.no_memory
+
+    with Stage(results, "extract", trace) as stage:
+        documents = [stage.timed(pdf_extract.extract_pages_uncached, path) for path in paths]
+        stage.extra["pages"] = sum(len(pages) for pages in documents)
+
+    with Stage(results, "chunk", trace) as stage:
+        chunks = [stage.timed(chunk_pages, pages) for pages in documents]
+        stage.extra["chunks"] = sum(len(file_chunks) for file_chunks in chunks)
+        stage.extra["chunk_tokens"] = sum(chunk["tokens"] for file_chunks in chunks for chunk in file_chunks)
+
+    store_directory = os.path.join(workdir, "store")
+    if args.backend == "chroma":
+        __import__('pysqlite3')
+        sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
+        import chromadb
+        store = chromadb.PersistentClient(path=store_directory).get_or_create_collection("BenchCollection")
+        dense = ChromaRetriever(store)
+    else:
+        store = NumpyVectorStore(store_directory)
+        dense = store
+    os.makedirs(store_directory, exist_ok=True)
+
+    with Stage(results, "ingest", trace) as stage:
+        report = sync_pdf_directory(store, client, args.data_dir, os.path.join(store_directory, MANIFEST_FILENAME))
+        if report["errors"]:
+            sys.exit(f"Ingestion failed: {report['errors']}")
+        stage.extra["files"] = len(report["indexed"])
+        stage.extra["embedding"] = report["embedding"]
+
+    with Stage(results, "lexical", trace):
+        retriever = HybridRetriever(dense, build_lexical_index(store, os.path.join(store_directory, "bm25.json")))
+
+    questions = QUESTIONS[:args.questions]
+    with Stage(results, "retrieve", trace) as stage:
+        retrieved = []
+        for question in questions:
+            def query_vector_db(query):
+                # Same steps as cps5.query_vector_db, without the Streamlit secrets lookup
+                hits = retriever.search(embed_query(client, query), k=3, query_text=query)
+                return hits, [describe_source(hit["metadata"]) for hit in hits]
+            retrieved.append(stage.timed(query_vector_db, question))
+
+    with Stage(results, "assemble", trace) as stage:
+        prompts = []
+        for question, (hits, _) in zip(questions, retrieved):
+            def assemble(query):
+                context, _ = assemble_context(hits)
+                return cps5.build_chatbot_messages(query, context, "English", "Summarize in 5 bullet points")
+            prompts.append(stage.timed(assemble, question))
+        prompt_tokens = [sum(len(encoding.encode(message["content"])) for message in messages) for messages in prompts]
+        stage.extra["prompt_tokens"] = {"mean": statistics.mean(prompt_tokens), "max": max(prompt_tokens)}
+
+    with Stage(results, "answer", trace) as stage:
+        ttfts = []
+        for messages in prompts:
+            stream = provider.stream(messages, model="gpt-4o")
+            stage.timed(lambda: "".join(stream))
+            ttfts.append(stream.stats["ttft"])
+        stage.extra["ttft_p50"] = percentile(ttfts, 50)
+
+    return results
+
+def compare(current, previous):
+    print(f"\nChange against {previous.get('commit') or 'previous run'} ({previous.get('created')})")
+    for name, stage in current["stages"].items():
+        before = previous.get("stages", {}).get(name)
+        if not before:
+            continue
+        key = "p50" if "p50" in stage and "p50" in before else "seconds"
+        change = (stage[key] / before[key] - 1) * 100 if before[key] else 0.0
+        print(f"  {name:<9} {key:<7} {before[key] * 1000:10.1f} ms -> {stage[key] * 1000:10.1f} ms  {change:+6.1f}%")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default=os.path.join(REPO_ROOT, "Lab4_datafiles"))
+    parser.add_argument("--backend", choices=["numpy", "chroma"], default="numpy")
+    parser.add_argument("--questions", type=int, default=len(QUESTIONS))
+    parser.add_argument("--ttft", type=float, default=0.2, help="mock seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="mock seconds between tokens")
+    parser.add_argument("--tokens", type=int, default=150, help="mock tokens per answer")
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="mock seconds per embeddings request")
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc, which slows Python-heavy stages")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    args = parser.parse_args()
+    args.data_dir = os.path.abspath(args.data_dir)
+    output = os.path.abspath(args.output) if args.output else None
+
+    process, base_url = start_server_process(ttft=args.ttft, token_delay=args.token_delay, tokens=args.tokens,
+                                             embedding_latency=args.embedding_latency)
+    os.environ["OPENAI_BASE_URL"] = base_url
+    original_directory = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            os.chdir(workdir)
+            if not args.no_memory:
+                tracemalloc.start()
+            stages = run_pipeline(args, base_url, workdir)
+            tracemalloc.stop()
+    finally:
+        os.chdir(original_directory)
+        process.terminate()
+
+    results = {
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "stages": stages,
+    }
+    print(f"{'stage':<9} {'total ms':>10} {'p50 ms':>9} {'p95 ms':>9} {'peak MiB':>9}")
+    for name, stage in stages.items():
+        p50 = f"{stage['p50'] * 1000:9.1f}" if "p50" in stage else f"{'':>9}"
+        p95 = f"{stage['p95'] * 1000:9.1f}" if "p95" in stage else f"{'':>9}"
+        memory = f"{stage['peak_memory_mb']:9.1f}" if "peak_memory_mb" in stage else f"{'':>9}"
+        print(f"{name:<9} {stage['seconds'] * 1000:10.1f} {p50} {p95} {memory}")
+    print(f"prompt tokens: mean {stages['assemble']['prompt_tokens']['mean']:.0f}, "
+          f"max {stages['assemble']['prompt_tokens']['max']}; "
+          f"{stages['chunk']['chunks']} chunks from {stages['extract']['pages']} pages")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            compare(results, json.load(file))
+    if output:
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        with open(output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+        print(f"Saved {output}")
+
+
+if __name__ == "__main__":
+    main()
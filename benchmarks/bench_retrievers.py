@@ -0,0 +1,123 @@
+"""Compare the Chroma and NumPy vector backends.
+
+Each backend runs in its own subprocess so import time and memory are
+measured from a clean interpreter. The corpus is random Gaussian vectors
+shaped like text-embedding-3-small output.
+
+    python benchmarks/bench_retrievers.py --chunks 2000 --queries 500
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+DIMENSIONS = 1536
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run_backend(backend, chunks, queries, seed):
+    started = time.perf_counter()
+    if backend == "chroma":
+        __import__('pysqlite3')
+        sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
+        import chromadb
+        from retrievers import ChromaRetriever
+    else:
+        from retrievers import NumpyVectorStore
+    import numpy as np
+    import_seconds = time.perf_counter() - started
+    rss_after_import = peak_rss_mb()
+
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((chunks, DIMENSIONS), dtype=np.float32)
+    query_vectors = rng.standard_normal((queries, DIMENSIONS), dtype=np.float32)
+    ids = [f"doc.pdf::{i}" for i in range(chunks)]
+    documents = [f"chunk {i}" for i in range(chunks)]
+    metadatas = [{"filename": "doc.pdf", "chunk": i, "page_start": 1, "page_end": 1} for i in range(chunks)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        if backend == "chroma":
+            collection = chromadb.PersistentClient(path=directory).get_or_create_collection("BenchCollection")
+            for start in range(0, chunks, 1000):
+                end = start + 1000
+                collection.add(documents=documents[start:end], metadatas=metadatas[start:end],
+                               ids=ids[start:end], embeddings=vectors[start:end].tolist())
+        else:
+            NumpyVectorStore(directory).add(documents, metadatas, ids, vectors)
+        build_seconds = time.perf_counter() - started
+
+        # Opening an existing index is what a server restart pays
+        started = time.perf_counter()
+        if backend == "chroma":
+            retriever = ChromaRetriever(chromadb.PersistentClient(path=directory).get_collection("BenchCollection"))
+        else:
+            retriever = NumpyVectorStore(directory)
+        open_seconds = time.perf_counter() - started
+
+        query_lists = query_vectors.tolist()
+        retriever.search(query_lists[0], k=3)  # warm up
+        latencies = []
+        for query in query_lists:
+            started = time.perf_counter()
+            retriever.search(query, k=3)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    return {
+        "backend": backend,
+        "chunks": chunks,
+        "import_ms": round(import_seconds * 1000, 1),
+        "build_ms": round(build_seconds * 1000, 1),
+        "open_ms": round(open_seconds * 1000, 1),
+        "query_p50_ms": round(percentile(latencies, 50), 3),
+        "query_p99_ms": round(percentile(latencies, 99), 3),
+        "rss_after_import_mb": round(rss_after_import, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backend", choices=["chroma", "numpy"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.backend:
+        print(json.dumps(run_backend(args.backend, args.chunks, args.queries, args.seed)))
+        return
+
+    results = []
+    for backend in ("numpy", "chroma"):
+        output = subprocess.run(
+            [sys.executable, __file__, "--backend", backend, "--chunks", str(args.chunks),
+             "--queries", str(args.queries), "--seed", str(args.seed)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    columns = ["backend", "import_ms", "build_ms", "open_ms", "query_p50_ms", "query_p99_ms",
+               "rss_after_import_mb", "peak_rss_mb"]
+    print(f"{args.chunks} chunks x {DIMENSIONS} dims, {args.queries} queries")
+    print("  ".join(f"{column:>19}" for column in columns))
+    for result in results:
+        print("  ".join(f"{result[column]:>19}" for column in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""Local stand-in for the OpenAI API, for benchmarks that must run without keys.
+
+Standard library only. Serves:
+
+  POST /v1/chat/completions  streamed (SSE) or plain completions; the answer
+                             is --tokens words, the first after --ttft seconds
+                             and the rest --token-delay seconds apart
+  POST /v1/embeddings        deterministic embeddings: hashed bag of words,
+                             so texts that share words get similar vectors
+  GET  /v1/models            a fixed model list (used to check API keys)
+
+Point the OpenAI SDK at it with base_url="http://127.0.0.1:PORT/v1" or the
+OPENAI_BASE_URL environment variable.
+
+    python benchmarks/mock_openai_server.py --port 8800 --ttft 0.3 --token-delay 0.02
+"""
+import argparse
+import base64
+import hashlib
+import json
+import math
+import os
+import re
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_CONFIG = {
+    "ttft": 0.2,  # seconds before the first token
+    "token_delay": 0.01,  # seconds between tokens
+    "tokens": 200,  # tokens per answer
+    "embedding_latency": 0.05,  # seconds per embeddings request
+    "dimensions": 1536,
+}
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_ANSWER_WORDS = ("residents", "should", "check", "in", "with", "their", "counselor", "before", "curfew",
+                 "and", "follow", "the", "program", "handbook", "for", "campus", "safety")
+
+
+# Function to embed text deterministically: every word adds +-1 to a few hashed dimensions
+def mock_embedding(text, dimensions):
+    vector = [0.0] * dimensions
+    for word in _WORD_RE.findall(text.lower()):
+        digest = hashlib.blake2b(word.encode("utf-8"), digest_size=16).digest()
+        for i in range(0, 16, 2):
+            index = int.from_bytes(digest[i:i + 2], "little") % dimensions
+            vector[index] += 1.0 if digest[i] & 1 else -1.0
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+def count_words(messages):
+    return sum(len(str(message.get("content", "")).split()) for message in messages)
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json({"object": "list", "data": [
+                {"id": model, "object": "model", "created": 0, "owned_by": "mock"}
+                for model in ("gpt-4o", "gpt-4o-mini", "text-embedding-3-small")
+            ]})
+        else:
+            self._send_json({"error": {"message": "not found"}}, status=404)
+
+    def do_POST(self):
+        request = self._read_json()
+        if self.path.endswith("/chat/completions"):
+            self._chat(request)
+        elif self.path.endswith("/embeddings"):
+            self._embeddings(request)
+        else:
+            self._send_json({"error": {"message": "not found"}}, status=404)
+
+    def _embeddings(self, request):
+        inputs = request.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        time.sleep(self.config["embedding_latency"])
+        dimensions = request.get("dimensions") or self.config["dimensions"]
+        data = []
+        for i, text in enumerate(inputs):
+            vector = mock_embedding(str(text), dimensions)
+            if request.get("encoding_format") == "base64":
+                vector = base64.b64encode(struct.pack(f"<{dimensions}f", *vector)).decode("ascii")
+            data.append({"object": "embedding", "index": i, "embedding": vector})
+        tokens = sum(len(str(text).split()) for text in inputs)
+        self._send_json({"object": "list", "data": data, "model": request.get("model"),
+                         "usage": {"prompt_tokens": tokens, "total_tokens": tokens}})
+
+    def _chat(self, request):
+        config = self.config
+        tokens = min(config["tokens"], request.get("max_tokens") or config["tokens"])
+        words = [(" " if i else "") + _ANSWER_WORDS[i % len(_ANSWER_WORDS)] for i in range(tokens)]
+        usage = {"prompt_tokens": count_words(request.get("messages", [])), "completion_tokens": tokens}
+        usage["total_tokens"] = usage["prompt_tokens"] + tokens
+        base = {"id": "chatcmpl-mock", "created": int(time.time()), "model": request.get("model", "gpt-4o")}
+
+        time.sleep(config["ttft"])
+        if not request.get("stream"):
+            time.sleep(config["token_delay"] * max(0, tokens - 1))
+            self._send_json(dict(base, object="chat.completion", usage=usage, choices=[{
+                "index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "".join(words)},
+            }]))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send_event(payload):
+            data = b"data: " + (payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")) + b"\n\n"
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        chunk = dict(base, object="chat.completion.chunk")
+        try:
+            for i, word in enumerate(words):
+                if i:
+                    time.sleep(config["token_delay"])
+                delta = {"content": word} if i else {"role": "assistant", "content": word}
+                send_event(dict(chunk, choices=[{"index": 0, "delta": delta, "finish_reason": None}]))
+            send_event(dict(chunk, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+            if (request.get("stream_options") or {}).get("include_usage"):
+                send_event(dict(chunk, choices=[], usage=usage))
+            send_event(b"[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading early
+            self.close_connection = True
+
+
+class MockOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, address, config):
+        super().__init__(address, MockOpenAIHandler)
+        self.config = config
+
+
+# Function to run the mock server on a background thread (port 0 picks a free port)
+def start_server(host="127.0.0.1", port=0, **config):
+    """Start the server and return (server, base_url); call server.shutdown() to stop it."""
+    server = MockOpenAIServer((host, port), dict(DEFAULT_CONFIG, **config))
+    threading.Thread(target=server.serve_forever, name="mock-openai", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+# Function to run the mock server in its own process, so it does not compete with the benchmark for the GIL
+def start_server_process(**config):
+    """Start the server as a subprocess and return (process, base_url); call process.terminate() to stop it."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    command = [sys.executable, os.path.abspath(__file__), "--port", str(port)]
+    for key, value in config.items():
+        command += ["--" + key.replace("_", "-"), str(value)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}/v1"
+    for _ in range(200):
+        try:
+            urllib.request.urlopen(base_url + "/models", timeout=1).read()
+            return process, base_url
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("Mock OpenAI server did not start")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--ttft", type=float, default=DEFAULT_CONFIG["ttft"])
+    parser.add_argument("--token-delay", type=float, default=DEFAULT_CONFIG["token_delay"])
+    parser.add_argument("--tokens", type=int, default=DEFAULT_CONFIG["tokens"])
+    parser.add_argument("--embedding-latency", type=float, default=DEFAULT_CONFIG["embedding_latency"])
+    parser.add_argument("--dimensions", type=int, default=DEFAULT_CONFIG["dimensions"])
+    args = parser.parse_args()
+
+    config = {key: getattr(args, key) for key in DEFAULT_CONFIG}
+    server = MockOpenAIServer((args.host, args.port), config)
+    print(f"Mock OpenAI API on http://{args.host}:{server.server_address[1]}/v1", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
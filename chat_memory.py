@@ -0,0 +1,120 @@
+import threading
+from collections import deque
+from functools import lru_cache
+
+import tiktoken
+
+MEMORY_MODEL = "gpt-4o-mini"
+
+
+# Function to load the tokenizer once per process
+@lru_cache(maxsize=None)
+def get_chat_encoding(model=MEMORY_MODEL):
+    return tiktoken.encoding_for_model(model)
+
+# Function to count the tokens of one piece of text (repeated texts are counted once)
+@lru_cache(maxsize=1024)
+def count_tokens(text):
+    return len(get_chat_encoding().encode(text))
+
+
+class TokenBuffer:
+    """Chat messages with their token counts, oldest first.
+
+    Each message is encoded once, when it is appended, and the buffer keeps a
+    running total, so trimming from the front is O(1) per message instead of
+    re-encoding the whole history after every pop.
+    """
+
+    def __init__(self, messages=()):
+        self._items = deque()  # (message, tokens)
+        self.total_tokens = 0
+        for message in messages:
+            self.append(message)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return (message for message, _ in self._items)
+
+    def append(self, message):
+        tokens = count_tokens(message["content"])
+        self._items.append((message, tokens))
+        self.total_tokens += tokens
+
+    def popleft(self):
+        message, tokens = self._items.popleft()
+        self.total_tokens -= tokens
+        return message
+
+    def trim(self, max_tokens):
+        """Drop the oldest messages until the buffer fits in max_tokens (always keeping one)."""
+        while self.total_tokens > max_tokens and len(self._items) > 1:
+            self.popleft()
+
+    def tail(self, max_tokens):
+        """Return the newest messages that fit in max_tokens (at least one), without changing the buffer."""
+        messages = []
+        used = 0
+        for message, tokens in reversed(self._items):
+            if messages and used + tokens > max_tokens:
+                break
+            messages.append(message)
+            used += tokens
+        messages.reverse()
+        return messages
+
+
+class RollingSummary:
+    """Conversation summary that is extended with new turns in the background.
+
+    Only the turns since the last summary are sent to the LLM, and only once
+    they add up to trigger_tokens. The update runs on a daemon thread after
+    the answer has streamed, so it never delays a reply. Until it finishes,
+    prompts use the previous summary plus the raw unsummarized turns.
+    """
+
+    def __init__(self, trigger_tokens=1000):
+        self.trigger_tokens = trigger_tokens
+        self.text = ""
+        self.summarized_count = 0  # how many messages the summary covers
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def pending(self, messages):
+        """Return the messages the summary does not cover yet."""
+        with self._lock:
+            return list(messages[self.summarized_count:])
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def should_refresh(self, messages):
+        if self.is_running():
+            return False
+        return sum(count_tokens(message["content"]) for message in self.pending(messages)) >= self.trigger_tokens
+
+    def refresh_in_background(self, summarize, messages):
+        """Start summarize(previous_summary, new_messages) on a thread and fold in its result."""
+        with self._lock:
+            previous = self.text
+            covered = len(messages)
+            new_messages = list(messages[self.summarized_count:covered])
+
+        def run():
+            try:
+                text = summarize(previous, new_messages)
+            except Exception as e:
+                # Keep the old summary; the turns stay pending and are retried next time
+                self.last_error = str(e)
+                return
+            with self._lock:
+                self.text = text
+                self.summarized_count = covered
+                self.last_error = None
+
+        self._thread = threading.Thread(target=run, name="conversation-summary", daemon=True)
+        self._thread.start()
+        return self._thread
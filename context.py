@@ -0,0 +1,65 @@
+import re
+
+from chat_memory import get_chat_encoding
+
+# Most tokens of retrieved text a RAG prompt may carry
+CONTEXT_TOKEN_BUDGET = 3000
+CONTEXT_MODEL = "gpt-4o"
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+
+
+# Function to split a chunk into sentences (paragraph breaks also end a sentence)
+def split_sentences(text):
+    return [sentence.strip() for sentence in _SENTENCE_END_RE.split(text) if sentence.strip()]
+
+def _normalize(text):
+    return " ".join(text.lower().split())
+
+# Function to build the prompt context from retrieved chunks within a token budget
+def assemble_context(hits, budget_tokens=CONTEXT_TOKEN_BUDGET, model=CONTEXT_MODEL):
+    """Join retrieved chunks into one context string of at most budget_tokens tokens.
+
+    Chunks are taken best score first. Sentences already present in the
+    context are skipped, which removes the overlap between neighbouring
+    chunks, and the context is cut at the last sentence that fits. Returns
+    (context, report) where report has the tokens used and how many chunks
+    contributed.
+    """
+    encoding = get_chat_encoding(model)
+    ordered = sorted(hits, key=lambda hit: hit.get("score") or 0.0, reverse=True)
+
+    parts = []
+    emitted = ""  # normalized text already in the context, for overlap checks
+    used_tokens = 0
+    chunks_used = 0
+    truncated = False
+    for hit in ordered:
+        kept = []
+        for sentence in split_sentences(hit["text"]):
+            normalized = _normalize(sentence)
+            # Covers repeated sentences and partial sentences cut by a chunk boundary
+            if normalized in emitted:
+                continue
+            tokens = len(encoding.encode(sentence)) + 1
+            if used_tokens + tokens > budget_tokens:
+                truncated = True
+                break
+            kept.append(sentence)
+            emitted += normalized + "\n"
+            used_tokens += tokens
+        if kept:
+            parts.append(" ".join(kept))
+            chunks_used += 1
+        if truncated:
+            break
+
+    context = "\n\n".join(parts)
+    report = {
+        "tokens": len(encoding.encode(context)),
+        "budget": budget_tokens,
+        "chunks_used": chunks_used,
+        "chunks_retrieved": len(hits),
+        "truncated": truncated,
+    }
+    return context, report
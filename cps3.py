@@ -1,274 +1,194 @@
 import streamlit as st
-import cohere
-import requests
-from bs4 import BeautifulSoup #Parses HTML for scraping text from web pages.
-import tiktoken #Utility to count tokens (text fragments) for OpenAI models.
-from openai import OpenAI
-import google.generativeai as genai
-
-# Function to read webpage content from a URL
-def read_webpage_from_url(url):
-    try:
-        response = requests.get(url) #Get the URL
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, "html.parser")
-        document = " ".join([p.get_text() for p in soup.find_all("p")]) #Extracts text inside <p> tags (paragraphs) and combines it into a single string
-        #f before the string tells Python to evaluate the expressions inside the {} and replace them with their values
-        return document
-    except requests.RequestException as e:
-        st.error(f"Error reading webpage from {url}: {e}")
-        return None
-    except Exception as e:
-        st.error(f"Error processing the webpage: {e}") #Returns the combined text or an error message if fetching or processing fails
-        return None
-
-# Function to calculate tokens - It ensures that LLM interactions do not exceed model token limits.
-def calculate_tokens(messages):
-    """Calculate total tokens for a list of messages."""
-    total_tokens = 0
-    encoding = tiktoken.encoding_for_model('gpt-4o-mini')
-    for msg in messages:
-        total_tokens += len(encoding.encode(msg['content']))
-    return total_tokens
-
-def truncate_messages_by_tokens(messages, max_tokens): #This function reduces the message history if the total token count exceeds the specified max_tokens. Old messages are removed until the token limit is met.
-    """Truncate the message buffer to ensure it stays within max_tokens."""
-    total_tokens = calculate_tokens(messages)
-    while total_tokens > max_tokens and len(messages) > 1:
-        messages.pop(0)
-        total_tokens = calculate_tokens(messages)
-    return messages
+from web_fetch import fetch_many #Cached, pooled and concurrent fetching and parsing of web pages
+from chat_memory import RollingSummary, TokenBuffer, get_chat_encoding #Token counting with one cached tokenizer per process
+import ledger #Token ledger; the background summary is billed to the session that started it
+from providers import check_api_key, get_provider #One long-lived client per provider, with a common token stream
+from stream_render import StreamRenderer #Throttled redraws of streamed answers
+from history_store import MEMORY_MESSAGES, HistoryStore, render_history, to_message #Bounded chat history that spills older turns to disk
+
+# Function to read webpage content from a list of URLs
+def read_webpages_from_urls(urls):
+    # All pages are fetched at once on a bounded thread pool; unchanged pages come from the cache
+    documents = []
+    for result in fetch_many(urls, extractor="paragraphs"): #Extracts text inside <p> tags (paragraphs) of each page, in the order given
+        if result.error is not None:
+            st.error(f"Error reading webpage from {result.url}: {result.error}") #A failing URL does not stop the others
+        elif result.text:
+            documents.append(result.text)
+    return documents
+
+# Function to turn the sidebar text into a list of URLs (one per line or separated by spaces)
+def parse_urls(text):
+    return [url for url in text.split() if url]
 
 # Function to verify OpenAI API key
-def verify_openai_key(api_key): #Verifies the OpenAI API key by trying to list available models. Returns a client object if successful.
+def verify_openai_key(api_key): #Verifies the OpenAI API key by trying to list available models. Returns the provider if successful.
     try:
-        client = OpenAI(api_key=api_key)
-        client.models.list()
-        return client, True, "API key is valid"
+        provider = get_provider("openai", api_key) #Created once per process and reused on every rerun
+        is_valid, message = check_api_key("openai", api_key)
+        return provider, is_valid, message
     except Exception as e:
         return None, False, str(e)
 
-# Function to generate summary using OpenAI - Sends a request to OpenAI's chat model and returns the stream of responses. If an error occurs, it displays the error in the Streamlit app
-def generate_openai_response(client, messages, model): 
-    try:
-        stream = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            stream=True,
-        )
-        return stream
-    except Exception as e:
-        st.error(f"Error generating response: {e}", icon="❌")
-        return None
-
 def verify_cohere_key(api_key): #Verifies the Cohere API key by running a small prompt and checking if the client works.
     try:
-        client = cohere.Client(api_key)
-        client.generate(prompt="Hello", max_tokens=5)
-        return client, True, "API key is valid"
+        provider = get_provider("cohere", api_key)
+        is_valid, message = check_api_key("cohere", api_key)
+        return provider, is_valid, message
     except Exception as e:
         return None, False, str(e)
 
-# Function to generate response using Cohere
-def generate_cohere_response(cohere, messages):
-    try:
-        stream = client.chat_stream(
-            model='command-r',
-            message=messages[-1]['content'],
-            chat_history=[{"role": m['role'], "message": m['content']} for m in messages[:-1]],
-            temperature=0,       
-            max_tokens=1500
-        )
-        return stream
-    except Exception as e:
-        st.error(f"Error generating response: {e}", icon="❌")
-        return None
-
 # Function to verify Gemini API key
 def verify_gemini_key(api_key):
     try:
-        # Configure the API key
-        genai.configure(api_key=api_key)
-        client = genai.GenerativeModel('gemini-pro')
-        return client, True, "API key is valid"
+        provider = get_provider("gemini", api_key) # Configures the API key
+        is_valid, message = check_api_key("gemini", api_key)
+        return provider, is_valid, message
     except Exception as e:
         return None, False, str(e)
 
-def generate_gemini_response(client, messages, prompt): #Sends the conversation history to Gemini's model and streams the response based on the user’s prompt.
+# Function to generate a response with any provider - Returns a stream of text pieces, the same for OpenAI, Cohere and Gemini.
+def generate_response(provider, messages, model=None):
     try:
-        msgs = []
-        for msg in messages:
-            role = "user" if msg["role"] == "user" else "model"
-            msgs.append({"role": role, "parts": msg["content"]})
-        response = client.generate_content(
-            contents=[*msgs, {"role": "user", "parts": [{"text": prompt}]}],
-            generation_config=genai.types.GenerationConfig(
-                temperature=0,
-                max_output_tokens=1500,
-            ),
-            stream=True
-        )
-        return response
+        return provider.stream(messages, model=model, max_tokens=1500)
     except Exception as e:
+        st.error(f"Error generating response: {e}", icon="❌")
         return None
 
-# Summarizes the conversation differently based on the selected LLM provider: Gemini, OpenAI, or Cohere.
-def generate_conversation_summary(client, messages, llm_provider):
-    if llm_provider == 'Gemini':
-        msgs = []
-        for msg in messages:
-            role = "user" if msg["role"] == "user" else "model"
-            msgs.append({"role": role, "parts": [{"text": msg["content"]}]})
-        prompt = {"role": "user", "parts": [{"text": "Summarize the key points of this conversation concisely:"}]}
-        response = client.generate_content(
-            contents=[prompt, *msgs],
-            generation_config=genai.types.GenerationConfig(
-                temperature=0,
-                max_output_tokens=150,
-            ),
-        )
-        return response.text
-    elif "OpenAI" in llm_provider:
-        summary_prompt = "Summarize the key points of this conversation concisely:"
-        for msg in messages:
-            summary_prompt += f"\n{msg['role']}: {msg['content']}"
-        response = client.chat.completions.create(
-            model="gpt-4o-mini" if llm_provider == "OpenAI GPT-4O-Mini" else "gpt-4o",
-            messages=[{"role": "user", "content": summary_prompt}],
-            max_tokens=150
-        )
-        return response.choices[0].message.content
-    else:  # Cohere
-        summary_prompt = "Summarize the key points of this conversation concisely:"
-        chat_history = []
-        for msg in messages:
-            chat_history.append({"role": msg['role'], "message": msg['content']})
-            summary_prompt += f"\n{msg['role']}: {msg['content']}"
-        response = client.chat(
-            model='command-r',
-            message=summary_prompt,
-            chat_history=chat_history,
-            temperature=0,       
-            max_tokens=150
-        )
-        return response.text
-
-st.title("Karan Shah 📄 Chatbot Interaction")
-st.write(
-    "Interact with the chatbot! "
-)
-
-# Sidebar: URL inputs
-st.sidebar.header("URL Inputs")
-url1 = st.sidebar.text_input("Enter the first URL:")
-url2 = st.sidebar.text_input("Enter the second URL (optional):")
-
-# Sidebar: LLM provider selection
-st.sidebar.header("LLM Provider")
-llm_provider = st.sidebar.selectbox(
-    "Choose your LLM provider:",
-    options=["OpenAI GPT-4O-Mini", "OpenAI GPT-4O", "Cohere", "Gemini"]
-)
-
-# Sidebar: Conversation memory type
-st.sidebar.header("Conversation Memory")
-memory_type = st.sidebar.radio(
-    "Choose conversation memory type:",
-    options=["Buffer of 5 questions", "Conversation summary", "Buffer of 5,000 tokens"]
-)
-# API key verification
-if "OpenAI" in llm_provider:
-    openai_api_key = st.secrets['openai']
-    client, is_valid, message = verify_openai_key(openai_api_key)
-    model = "gpt-4o-mini" if llm_provider == "OpenAI GPT-4O-Mini" else "gpt-4o"
-elif "Cohere" in llm_provider:
-    cohere_api_key = st.secrets['cohere']
-    client, is_valid, message = verify_cohere_key(cohere_api_key)
-else:
-    gemini_api_key = st.secrets['gemini']
-    client, is_valid, message = verify_gemini_key(gemini_api_key)
-
-if is_valid:
-    st.sidebar.success(f"{llm_provider} API key is valid!", icon="✅")
-else:
-    st.sidebar.error(f"Invalid {llm_provider} API key: {message}", icon="❌")
-    st.stop()
-
-# Initialize session state
-if 'messages' not in st.session_state:
-    st.session_state['messages'] = []
-
-# Process URLs
-documents = []
-if url1:
-    doc1 = read_webpage_from_url(url1)
-    if doc1:
-        documents.append(doc1)
-if url2:
-    doc2 = read_webpage_from_url(url2)
-    if doc2:
-        documents.append(doc2)
-
-# Combine documents
-combined_document = "\n\n".join(documents)
-
-# Display chat history
-for message in st.session_state.messages:
-    role = "user" if message["role"] == "user" else "system"
-    with st.chat_message(role):
-        content = message.get("content") or  message.get("parts", [{}])[0].get("text", "")
-        st.markdown(content)
-
-# Chat input
-if prompt := st.chat_input("What would you like to know?"):
-    # Add user message to chat history
-    with st.chat_message("user"):
-        st.markdown(prompt)
-
-    st.session_state.messages.append({"role": "user", "content": prompt})
-    context_message = {"role": "system", "content": f"Here are the documents to reference: {combined_document}"}
-    
-    messages_for_llm = [context_message] + st.session_state.messages
-    
-    # Apply conversation memory type
-    if memory_type == "Buffer of 5 questions":
-        messages_for_llm = messages_for_llm[-5:]  # System message + last 5 Q&A pairs
-    elif memory_type == "Conversation summary":
-        if 'conversation_summary' not in st.session_state:
-            st.session_state.conversation_summary = ""
-        st.session_state.conversation_summary = generate_conversation_summary(client, messages_for_llm , llm_provider)
-        messages_for_llm = [ context_message,
-        {"role": "system", "content": f"Conversation summary: {st.session_state.conversation_summary}"},
-        st.session_state.messages[-1]]  # Include only the latest user message
+# Builds the summarization instruction, folding in the summary so far when there is one
+def summary_instruction(previous_summary=""):
+    if not previous_summary:
+        return "Summarize the key points of this conversation concisely:"
+    return (f"Here is a summary of the conversation so far:\n{previous_summary}\n\n"
+            "Update it with the new messages below. Summarize the key points of the whole conversation concisely:")
+
+# Summarizes the conversation with the selected LLM provider: Gemini, OpenAI, or Cohere.
+# Pass previous_summary to fold only the new messages into an existing summary.
+def generate_conversation_summary(provider, messages, model=None, previous_summary="", context=None):
+    summary_prompt = summary_instruction(previous_summary)
+    for msg in messages:
+        summary_prompt += f"\n{msg['role']}: {msg['content']}"
+    return provider.complete([{"role": "user", "content": summary_prompt}], model=model, max_tokens=150,
+                             context=context)
+
+# Function to draw the page
+def render():
+    st.title("Karan Shah 📄 Chatbot Interaction")
+    st.write(
+        "Interact with the chatbot! "
+    )
+
+    # Sidebar: URL inputs
+    st.sidebar.header("URL Inputs")
+    urls = parse_urls(st.sidebar.text_area("Enter one or more URLs (one per line):"))
+
+    # Sidebar: LLM provider selection
+    st.sidebar.header("LLM Provider")
+    llm_provider = st.sidebar.selectbox(
+        "Choose your LLM provider:",
+        options=["OpenAI GPT-4O-Mini", "OpenAI GPT-4O", "Cohere", "Gemini"]
+    )
+
+    # Sidebar: Conversation memory type
+    st.sidebar.header("Conversation Memory")
+    memory_type = st.sidebar.radio(
+        "Choose conversation memory type:",
+        options=["Buffer of 5 questions", "Conversation summary", "Buffer of 5,000 tokens"]
+    )
+    # API key verification
+    if "OpenAI" in llm_provider:
+        openai_api_key = st.secrets['openai']
+        provider, is_valid, message = verify_openai_key(openai_api_key)
+        model = "gpt-4o-mini" if llm_provider == "OpenAI GPT-4O-Mini" else "gpt-4o"
+    elif "Cohere" in llm_provider:
+        cohere_api_key = st.secrets['cohere']
+        provider, is_valid, message = verify_cohere_key(cohere_api_key)
+        model = None # Provider default (command-r)
     else:
-        messages_for_llm = truncate_messages_by_tokens(messages_for_llm, 5000)
+        gemini_api_key = st.secrets['gemini']
+        provider, is_valid, message = verify_gemini_key(gemini_api_key)
+        model = None # Provider default (gemini-pro)
 
-    with st.chat_message("assistant"):
-        message_placeholder = st.empty()
-        full_response = ""
-        #bot_icon = "🤖"
-        if "OpenAI" in llm_provider:
-            stream = generate_openai_response(client, messages_for_llm, model)
-            if stream:
-                for chunk in stream:
-                    if chunk.choices[0].delta.content is not None:
-                        full_response += chunk.choices[0].delta.content
-                        message_placeholder.markdown(full_response + "▌")
-                message_placeholder.markdown(full_response)
-        elif "Cohere" in llm_provider:
-            stream = generate_cohere_response(client, messages_for_llm)
-            if stream:
-                for event in stream:
-                    if event.event_type == "text-generation":
-                        full_response += event.text
-                        message_placeholder.markdown(full_response + "▌")
-                message_placeholder.markdown(full_response)
+    if is_valid:
+        st.sidebar.success(f"{llm_provider} API key is valid!", icon="✅")
+    else:
+        st.sidebar.error(f"Invalid {llm_provider} API key: {message}", icon="❌")
+        st.stop()
+
+    # Initialize session state
+    if not isinstance(st.session_state.get('messages'), HistoryStore):
+        # Recent turns stay in memory and older ones spill to disk; it is indexed like a list
+        st.session_state['messages'] = HistoryStore(st.session_state.get('messages', []))
+    if 'token_buffer' not in st.session_state:
+        # The newest messages that fit in 5,000 tokens, with their token counts. It is trimmed on every
+        # append, so it stays bounded whichever memory type is selected
+        st.session_state['token_buffer'] = TokenBuffer(st.session_state.messages[-MEMORY_MESSAGES:])
+        st.session_state.token_buffer.trim(5000)
+
+    # Process URLs
+    documents = read_webpages_from_urls(urls)
+
+    # Combine documents
+    combined_document = "\n\n".join(documents)
+
+    # Display the latest chat history; earlier turns load on demand
+    render_history(st.session_state.messages, "messages", assistant_role="system")
+
+    # Chat input
+    if prompt := st.chat_input("What would you like to know?"):
+        # Add user message to chat history
+        with st.chat_message("user"):
+            st.markdown(prompt)
+
+        st.session_state.messages.append({"role": "user", "content": prompt})
+        st.session_state.token_buffer.append(st.session_state.messages[-1])
+        st.session_state.token_buffer.trim(5000)
+        context_message = {"role": "system", "content": f"Here are the documents to reference: {combined_document}"}
+
+        # Apply conversation memory type
+        if memory_type == "Buffer of 5 questions":
+            messages_for_llm = ([context_message] + st.session_state.messages[-5:])[-5:]  # System message + last 5 Q&A pairs
+        elif memory_type == "Conversation summary":
+            if not isinstance(st.session_state.get('conversation_summary'), RollingSummary):
+                st.session_state.conversation_summary = RollingSummary()
+            # Summary of older turns (updated in the background) plus the turns it does not cover yet
+            summary = st.session_state.conversation_summary
+            messages_for_llm = [context_message]
+            if summary.text:
+                messages_for_llm.append({"role": "system", "content": f"Conversation summary: {summary.text}"})
+            messages_for_llm += summary.pending(st.session_state.messages)  # Ends with the latest user message
         else:
-            response = generate_gemini_response(client, messages_for_llm, prompt)
-            if response:
-                for chunk in response:
-                    if chunk.text:
-                        full_response += chunk.text
-                        message_placeholder.markdown(full_response + "▌")
-                message_placeholder.markdown(full_response)
-    st.session_state.messages.append({"role": "system", "content": full_response})
+            # Take the newest messages that fit next to the documents. The documents are counted without
+            # count_tokens' cache, which would keep every large page text it saw in memory
+            token_buffer = st.session_state.token_buffer
+            context_tokens = len(get_chat_encoding().encode(context_message["content"]))
+            messages_for_llm = [context_message] + token_buffer.tail(5000 - context_tokens)
+
+        with st.chat_message("assistant"):
+            message_placeholder = st.empty()
+            full_response = ""
+            #bot_icon = "🤖"
+            stream = generate_response(provider, [to_message(message).as_dict() for message in messages_for_llm], model)
+            if stream:
+                renderer = StreamRenderer(message_placeholder) #Redraws every ~50 ms instead of on every token
+                try:
+                    for text in stream:
+                        renderer.write(text)
+                except Exception as e:
+                    st.error(f"Error generating response: {e}", icon="❌")
+                full_response = renderer.close()
+        st.session_state.messages.append({"role": "system", "content": full_response})
+        st.session_state.token_buffer.append(st.session_state.messages[-1])
+        st.session_state.token_buffer.trim(5000)
+
+        # Now that the answer has streamed, fold the new turns into the summary in the background
+        if memory_type == "Conversation summary" and summary.should_refresh(st.session_state.messages):
+            context = ledger.current_context()  # The summary thread has no session of its own; bill this one
+            summary.refresh_in_background(
+                lambda previous, new_messages: generate_conversation_summary(
+                    provider, new_messages, model, previous, context),
+                st.session_state.messages,
+            )
+
+if __name__ == "__main__":
+    render()
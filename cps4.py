@@ -1,95 +1,47 @@
 import streamlit as st
-from openai import OpenAI
-import os
-from PyPDF2 import PdfReader
+from context import assemble_context
+from history_store import HistoryStore, render_history
+from ingestion import describe_embedding, describe_source
+from resources import PDF_DIRECTORY, get_chat_provider, get_lab4_collection, get_query_embedding
+from stream_render import StreamRenderer
 
 
-# Workaround for sqlite3 issue in Streamlit Cloud
-__import__('pysqlite3')
-import sys
-sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
-
-import chromadb
-
-
-# Function to ensure the OpenAI client is initialized
-def ensure_openai_client():
-    if 'openai_client' not in st.session_state:
-        # Get the API key from Streamlit secrets
-        api_key = st.secrets["openai"]
-        # Initialize the OpenAI client and store it in session state
-        st.session_state.openai_client = OpenAI(api_key=api_key)
-
-# Function to create the ChromaDB collection
+# Function to get the shared document collection, indexing new or changed PDFs
 def create_lab4_collection():
-    if 'Lab4_vectorDB' not in st.session_state:
-        # Set up the ChromaDB client
-        persist_directory = os.path.join(os.getcwd(), "chroma_db")
-        client = chromadb.PersistentClient(path=persist_directory)
-        collection = client.get_or_create_collection("Lab4Collection")
-
-        ensure_openai_client()
-
-        # Define the directory containing the PDF files
-        pdf_dir = os.path.join(os.getcwd(), "Lab4_datafiles")
-        if not os.path.exists(pdf_dir):
-            st.error(f"Directory not found: {pdf_dir}")
-            return None
-
-        # Process each PDF file in the directory
-        for filename in os.listdir(pdf_dir):
-            if filename.endswith(".pdf"):
-                filepath = os.path.join(pdf_dir, filename)
-                try:
-                    # Extract text from the PDF
-                    with open(filepath, "rb") as file:
-                        pdf_reader = PdfReader(file)
-                        text = ''.join([page.extract_text() or '' for page in pdf_reader.pages])
-
-                    # Generate embeddings for the extracted text
-                    response = st.session_state.openai_client.embeddings.create(
-                        input=text, model="text-embedding-3-small"
-                    )
-                    embedding = response.data[0].embedding
-
-                    # Add the document to ChromaDB
-                    collection.add(
-                        documents=[text],
-                        metadatas=[{"filename": filename}],
-                        ids=[filename],
-                        embeddings=[embedding]
-                    )
-                except Exception as e:
-                    st.error(f"Error processing {filename}: {str(e)}")
-
-        # Store the collection in session state
-        st.session_state.Lab4_vectorDB = collection
+    collection, report = get_lab4_collection()
+    if collection is None:
+        st.error(f"Directory not found: {PDF_DIRECTORY}")
+        return None
+    for filename, error in report["errors"]:
+        st.error(f"Error processing {filename}: {error}")
+    return collection
 
-    return st.session_state.Lab4_vectorDB
+# Function to show how fast the last sync embedded the new or changed PDFs
+def show_embedding_report():
+    _, report = get_lab4_collection()
+    summary = describe_embedding(report["embedding"]) if report else None
+    if summary:
+        st.caption(summary)
 
 # Function to query the vector database
 def query_vector_db(collection, query):
-    ensure_openai_client()
+    """Return the chunks closest to the query (hit dicts, best first) and their sources.
+
+    collection is the hybrid BM25 + vector retriever from resources.get_lab4_collection.
+    """
     try:
-        # Generate embedding for the query
-        response = st.session_state.openai_client.embeddings.create(
-            input=query, model="text-embedding-3-small"
-        )
-        query_embedding = response.data[0].embedding
+        # Generate embedding for the query (repeated questions come from the cache)
+        query_embedding = get_query_embedding(query)
 
-        # Query the ChromaDB collection
-        results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=3
-        )
-        return results['documents'][0], [result['filename'] for result in results['metadatas'][0]]
+        # Search the vector and keyword indexes and fuse the rankings
+        hits = collection.search(query_embedding, k=3, query_text=query)
+        return hits, [describe_source(hit["metadata"]) for hit in hits]
     except Exception as e:
         st.error(f"Error querying the database: {str(e)}")
         return [], []
 
 # Function to get chatbot response using OpenAI's GPT model
 def get_chatbot_response(query, context):
-    ensure_openai_client()
     # Construct the prompt for the GPT model
     prompt = f"""You are an AI assistant with knowledge from specific documents. Use the following context to answer the user's question. If the information is not in the context, say you don't know based on the available information.
 
@@ -101,95 +53,101 @@ User Question: {query}
 Answer:"""
 
     try:
-        # Generate streaming response using OpenAI's chat completion
-        response_stream = st.session_state.openai_client.chat.completions.create(
-            model="gpt-4o",  # Using the latest GPT-4 model
-            messages=[
+        # Generate streaming response using OpenAI's chat completion; it runs on the shared
+        # event loop with the pooled client, within the provider's limit on open streams
+        response_stream = get_chat_provider().stream(
+            [
                 {"role": "system", "content": "You are a supportive assistant who will be assisting Summer Residential Counselors with their training materials. Please ensure that you provide them with helpful guidance"},
                 {"role": "user", "content": prompt}
             ],
-            stream=True  # Enable streaming
+            model="gpt-4o",  # Using the latest GPT-4 model
         )
         return response_stream
     except Exception as e:
         st.error(f"Error getting chatbot response: {str(e)}")
         return None
 
-# Initialize session state for chat history, system readiness, and collection
-if 'chat_history' not in st.session_state:
-    st.session_state.chat_history = []
-if 'system_ready' not in st.session_state:
-    st.session_state.system_ready = False
-if 'collection' not in st.session_state:
-    st.session_state.collection = None
-
-# Page content
-# st.title("Lab 4 - Document Chatbot")
-
-# Check if the system is ready, if not, prepare it
-if not st.session_state.system_ready:
-    # Show a spinner while processing documents
-    with st.spinner("Processing documents and preparing the system..."):
-        st.session_state.collection = create_lab4_collection()
-        if st.session_state.collection:
-            # Set the system as ready and show a success message
-            st.session_state.system_ready = True
-            st.success("AI ChatBot is Ready!!!")
-        else:
-            st.error("Failed to create or load the document collection. Please check the file path and try again.")
-
-# Only show the chat interface if the system is ready
-if st.session_state.system_ready and st.session_state.collection:
-    st.subheader("Chat with the AI Assistant")
-
-    # Display chat history
-    for message in st.session_state.chat_history:
-        if isinstance(message, dict):
-            # New format (dictionary with 'role' and 'content' keys)
-            with st.chat_message(message["role"]):
-                st.markdown(message["content"])
-        elif isinstance(message, tuple):
-            # Old format (tuple with role and content)
-            role, content = message
-            # Convert 'You' to 'user', and assume any other role is 'assistant'
-            with st.chat_message("user" if role == "You" else "assistant"):
-                st.markdown(content)
-
-    # User input
-    user_input = st.chat_input("Ask a question about the documents:")
-
-    if user_input:
-        # Display user message
-        with st.chat_message("user"):
-            st.markdown(user_input)
-
-        # Query the vector database
-        relevant_texts, relevant_docs = query_vector_db(st.session_state.collection, user_input)
-        context = "\n".join(relevant_texts)
-
-        # Get streaming chatbot response
-        response_stream = get_chatbot_response(user_input, context)
-
-        # Display AI response
-        with st.chat_message("assistant"):
-            response_placeholder = st.empty()
-            full_response = ""
-            for chunk in response_stream:
-                if chunk.choices[0].delta.content is not None:
-                    full_response += chunk.choices[0].delta.content
-                    response_placeholder.markdown(full_response + "▌")
-            response_placeholder.markdown(full_response)
-
-        # Add to chat history (new format)
-        st.session_state.chat_history.append({"role": "user", "content": user_input})
-        st.session_state.chat_history.append({"role": "assistant", "content": full_response})
-
-        # Display relevant documents
-        with st.expander("Relevant documents used"):
-            for doc in relevant_docs:
-                st.write(f"- {doc}")
-
-elif not st.session_state.system_ready:
-    st.info("The system is still preparing. Please wait...")
-else:
-    st.error("Failed to create or load the document collection. Please check the file path and try again.")
+# Function to draw the page
+def render():
+    # Initialize session state for chat history and system readiness
+    if not isinstance(st.session_state.get('chat_history'), HistoryStore):
+        # Recent turns stay in memory and older ones spill to disk; a plain list from before is converted
+        st.session_state.chat_history = HistoryStore(st.session_state.get('chat_history', []))
+    if 'system_ready' not in st.session_state:
+        st.session_state.system_ready = False
+
+    # Page content
+    # st.title("Lab 4 - Document Chatbot")
+
+    # Check if the system is ready, if not, prepare it
+    if not st.session_state.system_ready:
+        # Show a spinner while processing documents
+        with st.spinner("Processing documents and preparing the system..."):
+            collection = create_lab4_collection()
+            if collection:
+                # Set the system as ready and show a success message
+                st.session_state.system_ready = True
+                st.success("AI ChatBot is Ready!!!")
+                show_embedding_report()
+            else:
+                st.error("Failed to create or load the document collection. Please check the file path and try again.")
+    else:
+        # The collection is shared by all sessions, so this is a cached lookup
+        collection = create_lab4_collection()
+
+    # Only show the chat interface if the system is ready
+    if st.session_state.system_ready and collection:
+        st.subheader("Chat with the AI Assistant")
+
+        # Display the latest chat history; earlier turns load on demand
+        # (history_store.to_message reads both the old tuple and the new dict format)
+        render_history(st.session_state.chat_history, "chat_history")
+
+        # User input
+        user_input = st.chat_input("Ask a question about the documents:")
+
+        if user_input:
+            # Display user message
+            with st.chat_message("user"):
+                st.markdown(user_input)
+
+            # Query the vector database
+            relevant_hits, relevant_docs = query_vector_db(collection, user_input)
+
+            # Build a deduplicated context that fits the prompt token budget
+            context, context_report = assemble_context(relevant_hits)
+
+            # Get streaming chatbot response
+            response_stream = get_chatbot_response(user_input, context)
+
+            # Display AI response
+            with st.chat_message("assistant"):
+                response_placeholder = st.empty()
+                # Redraws every ~50 ms instead of re-sending the whole answer per token
+                renderer = StreamRenderer(response_placeholder)
+                try:
+                    for text in response_stream or []:
+                        renderer.write(text)
+                except Exception as e:
+                    st.error(f"Error getting chatbot response: {str(e)}")
+                full_response = renderer.close()
+
+            # Add to chat history (new format)
+            st.session_state.chat_history.append({"role": "user", "content": user_input})
+            st.session_state.chat_history.append({"role": "assistant", "content": full_response})
+
+            # Display relevant documents
+            with st.expander("Relevant documents used"):
+                for doc in relevant_docs:
+                    st.write(f"- {doc}")
+                if context_report:
+                    st.caption(f"Context: {context_report['tokens']} tokens from {context_report['chunks_used']} "
+                               f"of {context_report['chunks_retrieved']} retrieved chunks")
+
+    elif not st.session_state.system_ready:
+        st.info("The system is still preparing. Please wait...")
+    else:
+        st.error("Failed to create or load the document collection. Please check the file path and try again.")
+
+if __name__ == "__main__":
+    render()
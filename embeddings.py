@@ -0,0 +1,253 @@
+import hashlib
+import logging
+import random
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import openai
+import tiktoken
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Request limits of the OpenAI embeddings endpoint (with some headroom on tokens)
+MAX_BATCH_INPUTS = 2048
+MAX_BATCH_TOKENS = 250_000
+MAX_INPUT_TOKENS = 8191
+
+# How many batch requests may be in flight at once, and how hard to retry them
+MAX_CONCURRENT_REQUESTS = 4
+MAX_RETRIES = 6
+BASE_RETRY_DELAY = 0.5
+MAX_RETRY_DELAY = 20.0
+
+# Query embedding cache settings
+QUERY_CACHE_MAX_ENTRIES = 2048
+QUERY_CACHE_TTL_SECONDS = 7 * 24 * 3600
+QUERY_CACHE_MAX_DISK_ENTRIES = 100_000
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,  # also covers timeouts
+    openai.InternalServerError,
+)
+
+
+# Function to load the tokenizer once per process (text-embedding-3-* use cl100k_base)
+@lru_cache(maxsize=None)
+def get_encoding():
+    return tiktoken.get_encoding("cl100k_base")
+
+# Function to group inputs into batches that respect the request limits
+def plan_batches(token_counts, max_inputs=MAX_BATCH_INPUTS, max_tokens=MAX_BATCH_TOKENS):
+    """Return (start, end) index ranges covering token_counts in order."""
+    batches = []
+    start = 0
+    batch_tokens = 0
+    for i, count in enumerate(token_counts):
+        if count > MAX_INPUT_TOKENS:
+            raise ValueError(f"Input {i} has {count} tokens, the limit is {MAX_INPUT_TOKENS}")
+        if i > start and (i - start >= max_inputs or batch_tokens + count > max_tokens):
+            batches.append((start, i))
+            start = i
+            batch_tokens = 0
+        batch_tokens += count
+    if start < len(token_counts):
+        batches.append((start, len(token_counts)))
+    return batches
+
+# Function to pick how long to wait before the next attempt
+def retry_delay(attempt, error):
+    # Respect the server's Retry-After hint when it sends one
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), MAX_RETRY_DELAY)
+        except ValueError:
+            pass
+    # Otherwise exponential backoff with full jitter
+    return random.uniform(0, min(MAX_RETRY_DELAY, BASE_RETRY_DELAY * 2 ** attempt))
+
+# Function to embed one batch, retrying rate-limit and transient errors
+def embed_batch(openai_client, texts, model=EMBEDDING_MODEL):
+    """Return (embeddings in input order, number of retries that were needed)."""
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            with metrics.span("embed.batch", model=model):
+                response = openai_client.embeddings.create(input=texts, model=model)
+            ordered = sorted(response.data, key=lambda item: item.index)
+            return [item.embedding for item in ordered], attempt
+        except RETRYABLE_ERRORS as e:
+            if attempt == MAX_RETRIES:
+                raise
+            delay = retry_delay(attempt, e)
+            logger.warning("Embedding request failed (%s), retrying in %.1fs", e.__class__.__name__, delay)
+            time.sleep(delay)
+
+# Function to embed many texts with as few, concurrent requests as possible
+def embed_texts(openai_client, texts, model=EMBEDDING_MODEL, token_counts=None):
+    """Embed texts in batched requests and return (embeddings, stats).
+
+    Embeddings come back in the same order as texts. stats holds the number
+    of texts, tokens, requests and retries, the wall time and throughput.
+    """
+    if token_counts is None:
+        encoding = get_encoding()
+        token_counts = [len(encoding.encode(text)) for text in texts]
+    batches = plan_batches(token_counts)
+
+    # The batcher does its own backoff, so turn off the SDK's built-in retries
+    client = openai_client.with_options(max_retries=0)
+
+    started = time.perf_counter()
+    embeddings = []
+    retries = 0
+    if batches:
+        with ThreadPoolExecutor(max_workers=min(MAX_CONCURRENT_REQUESTS, len(batches))) as pool:
+            futures = [pool.submit(embed_batch, client, texts[start:end], model) for start, end in batches]
+            for future in futures:
+                batch_embeddings, batch_retries = future.result()
+                embeddings.extend(batch_embeddings)
+                retries += batch_retries
+    elapsed = time.perf_counter() - started
+
+    stats = {
+        "texts": len(texts),
+        "tokens": sum(token_counts),
+        "requests": len(batches),
+        "retries": retries,
+        "seconds": round(elapsed, 3),
+        "texts_per_second": round(len(texts) / elapsed, 1) if elapsed else 0.0,
+        "tokens_per_second": round(sum(token_counts) / elapsed, 1) if elapsed else 0.0,
+    }
+    if texts:
+        logger.info(
+            "Embedded %d texts (%d tokens) in %d requests, %d retries, %.2fs (%.0f tokens/s)",
+            stats["texts"], stats["tokens"], stats["requests"], stats["retries"],
+            elapsed, stats["tokens_per_second"],
+        )
+    return embeddings, stats
+
+# Function to reduce a question to the form used as its cache key
+def normalize_query(text):
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    return re.sub(r"\s+", " ", text.lower()).strip().rstrip("?!.").rstrip()
+
+class QueryEmbeddingCache:
+    """LRU cache of query embeddings with a TTL and an optional SQLite backing store.
+
+    Keys are the normalized query text plus the embedding model, so "When is
+    move-in?" and "when is move-in" share an entry. Embeddings are stored as
+    float32 arrays. The cache is safe to share between sessions.
+    """
+
+    def __init__(self, max_entries=QUERY_CACHE_MAX_ENTRIES, ttl_seconds=QUERY_CACHE_TTL_SECONDS, db_path=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (created_at, array of floats)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "key TEXT PRIMARY KEY, created_at REAL NOT NULL, embedding BLOB NOT NULL)"
+            )
+            # Drop expired rows and keep the store bounded
+            self._db.execute("DELETE FROM query_embeddings WHERE created_at < ?", (time.time() - ttl_seconds,))
+            self._db.execute(
+                "DELETE FROM query_embeddings WHERE key NOT IN "
+                "(SELECT key FROM query_embeddings ORDER BY created_at DESC LIMIT ?)",
+                (QUERY_CACHE_MAX_DISK_ENTRIES,),
+            )
+            self._db.commit()
+
+    @staticmethod
+    def make_key(text, model):
+        return hashlib.sha256(f"{model}\n{normalize_query(text)}".encode("utf-8")).hexdigest()
+
+    def get(self, text, model=EMBEDDING_MODEL):
+        """Return the cached embedding as a list of floats, or None."""
+        key = self.make_key(text, model)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[0] <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1].tolist()
+            if entry:
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT created_at, embedding FROM query_embeddings WHERE key = ?", (key,)
+                ).fetchone()
+                if row and now - row[0] <= self.ttl_seconds:
+                    vector = array("f")
+                    vector.frombytes(row[1])
+                    self._remember(key, row[0], vector)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return vector.tolist()
+
+            self.misses += 1
+            return None
+
+    def put(self, text, embedding, model=EMBEDDING_MODEL):
+        key = self.make_key(text, model)
+        created_at = time.time()
+        vector = array("f", embedding)
+        with self._lock:
+            self._remember(key, created_at, vector)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO query_embeddings (key, created_at, embedding) VALUES (?, ?, ?)",
+                    (key, created_at, vector.tobytes()),
+                )
+                self._db.commit()
+
+    def _remember(self, key, created_at, vector):
+        self._entries[key] = (created_at, vector)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        """Return hit/miss counters and the hit rate since the process started."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+# Function to embed a user question, going to the API only on a cache miss
+def embed_query(openai_client, text, cache=None, model=EMBEDDING_MODEL):
+    if cache is not None:
+        embedding = cache.get(text, model)
+        if embedding is not None:
+            return embedding
+    with metrics.span("embed.query", model=model):
+        response = openai_client.embeddings.create(input=text, model=model)
+    embedding = response.data[0].embedding
+    if cache is not None:
+        cache.put(text, embedding, model)
+    return embedding
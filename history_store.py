@@ -0,0 +1,174 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from array import array
+from collections import deque, namedtuple
+from itertools import islice
+
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+# Where older messages of each session are written, one JSONL file per session
+HISTORY_DIRECTORY = os.path.join(os.getcwd(), ".chat_history")
+
+# Newest messages kept in memory per session, messages drawn per "show earlier" click,
+# and how long spill files of finished sessions are kept
+MEMORY_MESSAGES = 40
+PAGE_SIZE = 20
+HISTORY_MAX_AGE_SECONDS = 7 * 24 * 60 * 60
+
+_pruned = False
+_prune_lock = threading.Lock()
+
+
+class ChatMessage(namedtuple("ChatMessage", ["role", "content"])):
+    """One chat message. message["content"] works too, so code written for dict messages keeps working."""
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return getattr(self, key)
+        return tuple.__getitem__(self, key)
+
+    def as_dict(self):
+        """Return the {"role", "content"} dict the LLM APIs expect."""
+        return {"role": self.role, "content": self.content}
+
+
+# Function to turn a message in any of the formats the pages have stored into a ChatMessage
+def to_message(message):
+    """Accept a ChatMessage, a {"role", "content"} dict, a Gemini-style
+    {"role", "parts": [{"text"}]} dict or an old ("You" | other, text) tuple."""
+    if isinstance(message, ChatMessage):
+        return message
+    if isinstance(message, dict):
+        content = message.get("content") or message.get("parts", [{}])[0].get("text", "")
+        return ChatMessage(message["role"], content)
+    role, content = message
+    return ChatMessage("user" if role == "You" else "assistant", content)
+
+# Function to delete spill files that no session has written to for a while
+def remove_stale_files(directory=HISTORY_DIRECTORY, max_age_seconds=HISTORY_MAX_AGE_SECONDS):
+    if not os.path.isdir(directory):
+        return
+    cutoff = time.time() - max_age_seconds
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if name.endswith(".jsonl") and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+class HistoryStore:
+    """Chat history of one session with bounded memory.
+
+    The newest max_in_memory messages stay in a deque. Older ones are
+    appended to a JSONL file, and the byte offset of each line is kept so
+    any range can be read back without loading the whole file. Indexing and
+    slicing use positions in the full history, like a list. Slices return
+    lists of ChatMessage.
+    """
+
+    def __init__(self, messages=(), max_in_memory=MEMORY_MESSAGES, directory=HISTORY_DIRECTORY):
+        global _pruned
+        with _prune_lock:
+            if not _pruned:
+                remove_stale_files(directory)
+                _pruned = True
+        self.max_in_memory = max_in_memory
+        self.path = os.path.join(directory, f"{uuid.uuid4().hex}.jsonl")
+        self._recent = deque()
+        self._offsets = array("q")  # byte offset of every spilled message
+        self._size = 0  # bytes written to the spill file
+        self._lock = threading.Lock()
+        for message in messages:
+            self.append(message)
+
+    @property
+    def spilled(self):
+        """Number of messages that live only on disk."""
+        return len(self._offsets)
+
+    def __len__(self):
+        return self.spilled + len(self._recent)
+
+    def append(self, message):
+        message = to_message(message)
+        with self._lock:
+            self._recent.append(message)
+            while len(self._recent) > self.max_in_memory:
+                try:
+                    self._spill(self._recent[0])
+                except OSError as e:
+                    # Keep the message in memory rather than lose it
+                    logger.warning("Could not write chat history to %s: %s", self.path, e)
+                    break
+                self._recent.popleft()
+        return message
+
+    def _spill(self, message):
+        line = (json.dumps([message.role, message.content]) + "\n").encode("utf-8")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "ab") as file:
+            file.write(line)
+        self._offsets.append(self._size)
+        self._size += len(line)
+
+    def _read_spilled(self, start, stop):
+        if start >= stop:
+            return []
+        end = self._offsets[stop] if stop < self.spilled else self._size
+        with open(self.path, "rb") as file:
+            file.seek(self._offsets[start])
+            data = file.read(end - self._offsets[start])
+        return [ChatMessage(*json.loads(line)) for line in data.splitlines()]
+
+    def __getitem__(self, index):
+        with self._lock:
+            total = len(self)
+            spilled = self.spilled
+            if isinstance(index, slice):
+                start, stop, step = index.indices(total)
+                if step != 1:
+                    raise ValueError("HistoryStore slices must have a step of 1")
+                if start >= stop:
+                    return []
+                messages = self._read_spilled(start, min(stop, spilled))
+                return messages + list(islice(self._recent, max(start - spilled, 0), max(stop - spilled, 0)))
+            if index < 0:
+                index += total
+            if not 0 <= index < total:
+                raise IndexError("history index out of range")
+            if index >= spilled:
+                return self._recent[index - spilled]
+            return self._read_spilled(index, index + 1)[0]
+
+
+# Function to draw the newest messages of a history, with a button that pages in earlier ones
+def render_history(history, key, assistant_role="assistant", page_size=PAGE_SIZE):
+    """Draw the last page_size messages; each "Show earlier" click adds page_size more.
+
+    key names the pager in st.session_state, so each page keeps its own
+    position. Messages that are not from the user are drawn with
+    assistant_role.
+    """
+    shown_key = f"{key}_shown"
+
+    def show_earlier():
+        st.session_state[shown_key] = st.session_state.get(shown_key, page_size) + page_size
+
+    # The click is applied in a callback, before the rerun draws anything
+    shown = st.session_state.get(shown_key, page_size)
+    if len(history) > shown:
+        st.button(f"Show earlier messages ({len(history) - shown} more)", key=f"{key}_show_earlier",
+                  on_click=show_earlier)
+    for message in history[-shown:]:
+        with st.chat_message("user" if message.role == "user" else assistant_role):
+            st.markdown(message.content)
@@ -0,0 +1,98 @@
+import re
+
+from bs4 import BeautifulSoup
+
+# Optional fast parsers; html.parser (through BeautifulSoup) is always available
+try:
+    import lxml.etree
+    import lxml.html
+except ImportError:
+    lxml = None
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+# Elements whose text is never page content
+BOILERPLATE_TAGS = ("script", "style", "noscript", "template", "svg", "iframe", "nav", "footer", "aside", "form")
+
+# Elements that end a line, so paragraphs, list items and headings stay separate
+BLOCK_TAGS = ("p", "div", "section", "article", "main", "header", "li", "dt", "dd", "tr", "td", "th",
+              "h1", "h2", "h3", "h4", "h5", "h6", "blockquote", "pre", "br", "hr", "table", "ul", "ol")
+
+_SPACES_RE = re.compile(r"[ \t\r\f\v\xa0]+")
+
+
+def _tidy(text):
+    # Collapse runs of spaces and drop blank lines, keeping one block per line
+    lines = (_SPACES_RE.sub(" ", line).strip() for line in text.split("\n"))
+    return "\n".join(line for line in lines if line)
+
+def _with_lxml(html, mode):
+    if not html.strip():
+        return ""
+    try:
+        root = lxml.html.fromstring(html)
+    except (lxml.etree.ParserError, ValueError):
+        # Comment-only pages ("Document is empty") and str input with an XML encoding declaration
+        return _with_html_parser(html, mode)
+    for element in list(root.iter(*BOILERPLATE_TAGS)):
+        element.drop_tree()
+    if mode == "paragraphs":
+        return "\n".join(_tidy(p.text_content()) for p in root.iter("p"))
+    for element in root.iter(*BLOCK_TAGS):
+        element.tail = "\n" + (element.tail or "")
+    bodies = root.xpath("//body")
+    return _tidy((bodies[0] if bodies else root).text_content())
+
+def _with_selectolax(html, mode):
+    tree = LexborHTMLParser(html)
+    tree.strip_tags(list(BOILERPLATE_TAGS))
+    if mode == "paragraphs":
+        return "\n".join(_tidy(p.text(separator="")) for p in tree.css("p"))
+    for node in tree.css(", ".join(BLOCK_TAGS)):
+        node.insert_after("\n")
+    root = tree.body or tree.root
+    return _tidy(root.text(separator="")) if root is not None else ""
+
+def _with_html_parser(html, mode):
+    soup = BeautifulSoup(html, "html.parser")
+    for element in soup.find_all(BOILERPLATE_TAGS):
+        element.decompose()
+    if mode == "paragraphs":
+        return "\n".join(_tidy(p.get_text()) for p in soup.find_all("p"))
+    for element in soup.find_all(BLOCK_TAGS):
+        element.insert_after("\n")
+    return _tidy((soup.body or soup).get_text())
+
+# Fastest first; the first installed one is the default
+PARSERS = {
+    "selectolax": _with_selectolax,
+    "lxml": _with_lxml,
+    "html.parser": _with_html_parser,
+}
+
+
+def available_parsers():
+    installed = {"selectolax": LexborHTMLParser is not None, "lxml": lxml is not None, "html.parser": True}
+    return [name for name in PARSERS if installed[name]]
+
+def default_parser():
+    return available_parsers()[0]
+
+# Function to turn an HTML page into clean text for the LLM or the chunker
+def extract(html, mode="text", parser=None):
+    """Return the readable text of an HTML page (str or bytes).
+
+    Scripts, styles, navigation, footers and other boilerplate are removed
+    first. mode="text" keeps all remaining body text, one block per line;
+    mode="paragraphs" keeps only the <p> elements. The result can go straight
+    to ingestion.chunk_pages([text]).
+    """
+    if mode not in ("text", "paragraphs"):
+        raise ValueError(f"Unknown extraction mode: {mode}")
+    parser = parser or default_parser()
+    if parser not in PARSERS:
+        raise ValueError(f"Unknown HTML parser: {parser}")
+    return PARSERS[parser](html, mode)
@@ -0,0 +1,253 @@
+import hashlib
+import json
+import logging
+import os
+import time
+
+import metrics
+from embeddings import EMBEDDING_MODEL, embed_texts, get_encoding
+from pdf_extract import default_backend, extract_pages
+
+logger = logging.getLogger(__name__)
+
+# Chunking settings for the PDF ingestion stage
+CHUNK_TOKENS = 400
+CHUNK_OVERLAP = 80
+
+# Manifest recording which file contents are already in the collection
+MANIFEST_FILENAME = "ingest_manifest.json"
+MANIFEST_VERSION = 1
+
+# A file that failed to index is retried after 1, 2, 4, ... minutes, and at least once an hour
+RETRY_BASE_SECONDS = 60
+RETRY_MAX_SECONDS = 60 * 60
+
+
+# Function to split page texts into overlapping, token-bounded chunks
+def chunk_pages(pages, chunk_tokens=CHUNK_TOKENS, overlap=CHUNK_OVERLAP):
+    """Split pages into overlapping token windows tagged with the pages they span."""
+    if overlap >= chunk_tokens:
+        raise ValueError("overlap must be smaller than chunk_tokens")
+    encoding = get_encoding()
+
+    # Tokenize page by page so every token remembers the page it came from
+    tokens = []
+    token_pages = []
+    for page_number, text in enumerate(pages, start=1):
+        if not text.strip():
+            continue
+        page_tokens = encoding.encode(text + "\n")
+        tokens.extend(page_tokens)
+        token_pages.extend([page_number] * len(page_tokens))
+
+    chunks = []
+    step = chunk_tokens - overlap
+    for start in range(0, len(tokens), step):
+        window = tokens[start:start + chunk_tokens]
+        chunks.append({
+            "text": encoding.decode(window),
+            "page_start": token_pages[start],
+            "page_end": token_pages[start + len(window) - 1],
+            "tokens": len(window),
+        })
+        if start + chunk_tokens >= len(tokens):
+            break
+    return chunks
+
+# Function to store the embedded chunks of one PDF as separate vectors
+def store_pdf_chunks(collection, filename, chunks, embeddings):
+    """Replace the vectors of one file with the given chunks and embeddings."""
+    # Remove vectors left over from an earlier run of this file
+    collection.delete(where={"filename": filename})
+    if not chunks:
+        return
+
+    collection.add(
+        documents=[chunk["text"] for chunk in chunks],
+        metadatas=[
+            {
+                "filename": filename,
+                "chunk": i,
+                "page_start": chunk["page_start"],
+                "page_end": chunk["page_end"],
+            }
+            for i, chunk in enumerate(chunks)
+        ],
+        ids=[f"{filename}::{i}" for i in range(len(chunks))],
+        embeddings=embeddings
+    )
+
+# Function to describe where a retrieved chunk came from
+def describe_source(metadata):
+    filename = metadata.get("filename", "unknown")
+    page_start = metadata.get("page_start")
+    page_end = metadata.get("page_end")
+    if page_start is None:
+        return filename
+    if page_start == page_end:
+        return f"{filename} (p. {page_start})"
+    return f"{filename} (pp. {page_start}-{page_end})"
+
+# Function to summarize the embedding throughput of a sync for display, or None if nothing was embedded
+def describe_embedding(stats):
+    if not stats or not stats["texts"]:
+        return None
+    return (f"Embedded {stats['texts']:,} chunks ({stats['tokens']:,} tokens) in {stats['requests']} requests "
+            f"and {stats['seconds']:.1f}s ({stats['tokens_per_second']:,.0f} tokens/s, {stats['retries']} retries)")
+
+# Function to hash a file's content so unchanged files can be skipped
+def file_sha256(filepath):
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Function to describe the settings that produced the stored vectors
+def chunking_params():
+    return {
+        "embedding_model": EMBEDDING_MODEL,
+        "chunk_tokens": CHUNK_TOKENS,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "pdf_backend": default_backend(),
+    }
+
+def load_manifest(manifest_path):
+    """Load the ingestion manifest, or an empty one if it is missing or unreadable."""
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as file:
+            manifest = json.load(file)
+        if manifest.get("version") == MANIFEST_VERSION:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {"version": MANIFEST_VERSION, "files": {}, "failed": {}}
+
+# Function to decide when a file that failed may be tried again
+def retry_at(failure):
+    delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (failure["attempts"] - 1))
+    return failure["failed_at"] + delay
+
+def save_manifest(manifest_path, manifest):
+    """Write the manifest atomically so a crash never leaves it half written."""
+    os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+# Function to fingerprint the whole indexed corpus from its manifest
+def corpus_hash(manifest):
+    """Hash of every indexed file's content and parameters; changes whenever the collection does."""
+    digest = hashlib.sha256()
+    for filename, entry in sorted(manifest["files"].items()):
+        digest.update(json.dumps([filename, entry["sha256"], entry["params"]], sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+# Function to bring the collection in line with the PDFs on disk
+def sync_pdf_directory(collection, openai_client, pdf_dir, manifest_path):
+    """Index new or changed PDFs, skip unchanged ones and purge deleted ones.
+
+    Returns a report dict with the filenames that were indexed, skipped and
+    removed, (filename, message) pairs for files that failed, the embedding
+    throughput stats, the hash of the resulting corpus, and retry_at: the
+    earliest time a failed file is due another attempt (None if none failed).
+
+    Failures are remembered in the manifest with their content hash. An
+    unchanged file that failed is not tried again until its backoff has
+    passed; until then it is listed in "deferred" and keeps its error. A
+    changed file that fails to re-index keeps its previous vectors.
+    """
+    report = {"indexed": [], "skipped": [], "removed": [], "errors": [], "deferred": [], "embedding": None,
+              "corpus_hash": None, "retry_at": None}
+    manifest = load_manifest(manifest_path)
+    entries = manifest["files"]
+    failures = manifest.setdefault("failed", {})
+    now = time.time()
+
+    def record_failure(filename, sha256, error):
+        previous = failures.get(filename)
+        attempts = previous["attempts"] + 1 if previous and previous.get("sha256") == sha256 else 1
+        failures[filename] = {"sha256": sha256, "failed_at": now, "attempts": attempts, "error": str(error)}
+        report["errors"].append((filename, str(error)))
+
+    # A wiped or recreated collection invalidates everything the manifest remembers
+    if entries and collection.count() == 0:
+        entries.clear()
+
+    params = chunking_params()
+    on_disk = sorted(name for name in os.listdir(pdf_dir) if name.endswith(".pdf"))
+    try:
+        # Find new or changed files and chunk them
+        pending = []
+        for filename in on_disk:
+            filepath = os.path.join(pdf_dir, filename)
+            sha256 = None
+            try:
+                sha256 = file_sha256(filepath)
+                entry = entries.get(filename)
+                if entry and entry.get("sha256") == sha256 and entry.get("params") == params:
+                    report["skipped"].append(filename)
+                    continue
+                failure = failures.get(filename)
+                if failure and failure.get("sha256") == sha256 and now < retry_at(failure):
+                    report["deferred"].append(filename)
+                    report["errors"].append((filename, failure["error"]))
+                    continue
+                # The old entry stays until the new vectors are stored, so a failed re-index keeps serving
+                # (and can still purge) the previous version
+                with metrics.span("ingest.extract"):
+                    pages = extract_pages(filepath, sha256=sha256)
+                with metrics.span("ingest.chunk"):
+                    pending.append((filename, sha256, chunk_pages(pages)))
+            except Exception as e:
+                record_failure(filename, sha256, e)
+
+        # Embed the chunks of every pending file together in as few requests as possible
+        all_chunks = [chunk for _, _, chunks in pending for chunk in chunks]
+        try:
+            with metrics.span("ingest.embed"):
+                embeddings, report["embedding"] = embed_texts(
+                    openai_client,
+                    [chunk["text"] for chunk in all_chunks],
+                    token_counts=[chunk["tokens"] for chunk in all_chunks],
+                )
+        except Exception as e:
+            for filename, sha256, _ in pending:
+                record_failure(filename, sha256, e)
+            pending = []
+
+        # Replace only the vectors of the files that changed
+        offset = 0
+        for filename, sha256, chunks in pending:
+            file_embeddings = embeddings[offset:offset + len(chunks)]
+            offset += len(chunks)
+            try:
+                with metrics.span("ingest.store"):
+                    store_pdf_chunks(collection, filename, chunks, file_embeddings)
+                entries[filename] = {"sha256": sha256, "params": params, "chunks": len(chunks)}
+                failures.pop(filename, None)
+                report["indexed"].append(filename)
+            except Exception as e:
+                # store_pdf_chunks may have deleted the old vectors already; drop whatever is left
+                entries.pop(filename, None)
+                try:
+                    collection.delete(where={"filename": filename})
+                except Exception:
+                    pass  # The failure record still purges them once the file is gone
+                record_failure(filename, sha256, e)
+
+        # Purge vectors of files that no longer exist, including ones whose last attempt failed
+        for filename in sorted(set(entries) - set(on_disk)):
+            collection.delete(where={"filename": filename})
+            del entries[filename]
+            report["removed"].append(filename)
+        for filename in sorted(set(failures) - set(on_disk)):
+            collection.delete(where={"filename": filename})
+            del failures[filename]
+    finally:
+        save_manifest(manifest_path, manifest)
+    report["corpus_hash"] = corpus_hash(manifest)
+    if failures:
+        report["retry_at"] = min(retry_at(failure) for failure in failures.values())
+    return report
@@ -0,0 +1,158 @@
+import os
+import sqlite3
+import threading
+import time
+
+# Local SQLite file with one row per LLM call
+LEDGER_PATH = os.path.join(os.getcwd(), "token_ledger.sqlite3")
+
+# Tokens (prompt + completion) one browser session may use; secrets may set session_token_budget
+SESSION_TOKEN_BUDGET = 200_000
+
+# Approximate list prices in USD per million (prompt, completion) tokens; update them when they change
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "command-r": (0.15, 0.60),
+    "gemini-pro": (0.50, 1.50),
+}
+
+# Characters of the last user message kept with each call, to spot the prompts that cost the most
+PROMPT_PREVIEW_CHARS = 120
+
+# Columns a summary may be grouped by
+GROUP_COLUMNS = ("session", "page", "provider", "model")
+
+_context = threading.local()
+_ledger = None
+_ledger_lock = threading.Lock()
+
+
+class BudgetExceeded(RuntimeError):
+    """Raised instead of starting an LLM call once a session has used its token budget."""
+
+
+# Function to tag the LLM calls made on this thread with a session and page
+def set_context(session=None, page=None, budget=None):
+    """Remember who is asking for the calls started on the current thread.
+
+    Streamlit runs each rerun of a session on its own thread, so
+    streamlit_app sets this before drawing the page.
+    """
+    _context.value = {"session": session, "page": page, "budget": budget}
+
+def current_context():
+    return getattr(_context, "value", None) or {"session": None, "page": None, "budget": None}
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    """Return the USD cost of a call, or None for a model without a known price."""
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return None
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+
+
+class TokenLedger:
+    """Records the tokens of every LLM call in SQLite and sums them up.
+
+    One instance is shared by all sessions and by the provider event loop
+    thread, so every query runs under a lock.
+    """
+
+    def __init__(self, db_path=LEDGER_PATH):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS llm_calls ("
+            "id INTEGER PRIMARY KEY, created_at REAL NOT NULL, session TEXT, page TEXT, "
+            "provider TEXT NOT NULL, model TEXT, prompt_tokens INTEGER NOT NULL, "
+            "completion_tokens INTEGER NOT NULL, usage_source TEXT NOT NULL, cost_usd REAL, "
+            "seconds REAL, ttft REAL, prompt_preview TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS llm_calls_session ON llm_calls (session)")
+        self._db.commit()
+
+    def record(self, provider, model, prompt_tokens, completion_tokens, usage_source="usage",
+               context=None, seconds=None, ttft=None, prompt_preview=None):
+        """Store one call; usage_source is "usage" when the provider reported the counts, else "estimate"."""
+        context = context or current_context()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO llm_calls (created_at, session, page, provider, model, prompt_tokens, "
+                "completion_tokens, usage_source, cost_usd, seconds, ttft, prompt_preview) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), context.get("session"), context.get("page"), provider, model,
+                 prompt_tokens, completion_tokens, usage_source,
+                 estimate_cost(model, prompt_tokens, completion_tokens), seconds, ttft,
+                 (prompt_preview or "")[:PROMPT_PREVIEW_CHARS] or None),
+            )
+            self._db.commit()
+
+    def session_tokens(self, session):
+        """Return the prompt + completion tokens recorded for a session."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT COALESCE(SUM(prompt_tokens + completion_tokens), 0) FROM llm_calls WHERE session = ?",
+                (session,),
+            ).fetchone()
+        return row[0]
+
+    def summary(self, group_by=("model",), since=None):
+        """Return call counts, tokens and cost per group, most tokens first."""
+        unknown = [column for column in group_by if column not in GROUP_COLUMNS]
+        if unknown:
+            raise ValueError(f"Cannot group by {unknown}; choose from {GROUP_COLUMNS}")
+        columns = ", ".join(group_by)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {columns}, COUNT(*), SUM(prompt_tokens), SUM(completion_tokens), SUM(cost_usd), "
+                f"AVG(seconds) FROM llm_calls WHERE created_at >= ? GROUP BY {columns} "
+                f"ORDER BY SUM(prompt_tokens + completion_tokens) DESC",
+                (since or 0,),
+            ).fetchall()
+        keys = list(group_by) + ["calls", "prompt_tokens", "completion_tokens", "cost_usd", "mean_seconds"]
+        return [dict(zip(keys, row)) for row in rows]
+
+    def top_prompts(self, limit=10, since=None):
+        """Return the calls with the largest prompts, to find what inflates latency and spend."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT created_at, session, page, model, prompt_tokens, completion_tokens, cost_usd, seconds, "
+                "prompt_preview FROM llm_calls WHERE created_at >= ? ORDER BY prompt_tokens DESC LIMIT ?",
+                (since or 0, limit),
+            ).fetchall()
+        keys = ["created_at", "session", "page", "model", "prompt_tokens", "completion_tokens", "cost_usd",
+                "seconds", "prompt_preview"]
+        return [dict(zip(keys, row)) for row in rows]
+
+
+# Function to get the process-wide ledger
+def get_ledger():
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = TokenLedger()
+        return _ledger
+
+# Function to stop a session that has used up its tokens before it starts another call
+def check_budget(context=None):
+    """Raise BudgetExceeded when the session in context is over its token budget.
+
+    Calls without a session (scripts, background threads) are not limited.
+    """
+    context = context or current_context()
+    if context.get("session") is None:
+        return
+    budget = context.get("budget") or SESSION_TOKEN_BUDGET
+    used = get_ledger().session_tokens(context["session"])
+    if used >= budget:
+        raise BudgetExceeded(f"This session has used its budget of {budget:,} tokens ({used:,} used).")
+
+# Function to report a session's usage against its budget, for display
+def session_budget(context=None):
+    """Return (tokens used, budget) for the session in context."""
+    context = context or current_context()
+    budget = context.get("budget") or SESSION_TOKEN_BUDGET
+    if context.get("session") is None:
+        return 0, budget
+    return get_ledger().session_tokens(context["session"]), budget
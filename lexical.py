@@ -0,0 +1,151 @@
+import base64
+import json
+import math
+import os
+import re
+from array import array
+from collections import Counter, defaultdict
+
+import metrics
+
+LEXICAL_INDEX_FILENAME = "bm25_index.json"
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Reciprocal rank fusion constant and how deep each ranking is read
+RRF_K = 60
+FUSION_CANDIDATES = 20
+
+# Keep numbers, dates and policy codes like "3.2" or "10/14" as single tokens
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[./:-][a-z0-9]+)*")
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it my of on or "
+    "the to was what when where which who why will with you your".split()
+)
+
+
+# Function to split text into lowercase search terms
+def tokenize(text):
+    return [token for token in _TOKEN_RE.findall(text.lower()) if token not in _STOPWORDS]
+
+
+class BM25Index:
+    """Precomputed BM25 inverted index over the ingested chunks.
+
+    Every posting already holds its final BM25 weight (idf times the
+    saturated, length-normalized term frequency), so scoring a query is just
+    summing floats from the postings of its terms. Postings are stored in
+    compact arrays: doc numbers as 32-bit ints, weights as 32-bit floats.
+    """
+
+    def __init__(self, ids, documents, metadatas, postings):
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        self.postings = postings  # term -> (array('i') of doc numbers, array('f') of weights)
+
+    @classmethod
+    def build(cls, ids, documents, metadatas):
+        term_counts = [Counter(tokenize(text)) for text in documents]
+        lengths = [sum(counts.values()) for counts in term_counts]
+        average_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+        document_frequency = Counter(term for counts in term_counts for term in counts)
+        total = len(documents)
+
+        postings = defaultdict(lambda: (array("i"), array("f")))
+        for doc, counts in enumerate(term_counts):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc] / average_length) if average_length else BM25_K1
+            for term, tf in counts.items():
+                df = document_frequency[term]
+                idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+                doc_numbers, weights = postings[term]
+                doc_numbers.append(doc)
+                weights.append(idf * tf * (BM25_K1 + 1) / (tf + norm))
+        return cls(list(ids), list(documents), list(metadatas), dict(postings))
+
+    def search(self, query, k=FUSION_CANDIDATES):
+        """Return (doc number, score) pairs for the k best-scoring chunks."""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting:
+                for doc, weight in zip(*posting):
+                    scores[doc] += weight
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def hit(self, doc, score):
+        return {"id": self.ids[doc], "text": self.documents[doc], "metadata": self.metadatas[doc], "score": score}
+
+    def save(self, path):
+        data = {
+            "ids": self.ids,
+            "documents": self.documents,
+            "metadatas": self.metadatas,
+            "postings": {
+                term: [base64.b64encode(docs.tobytes()).decode("ascii"),
+                       base64.b64encode(weights.tobytes()).decode("ascii")]
+                for term, (docs, weights) in self.postings.items()
+            },
+        }
+        with open(path + ".tmp", "w", encoding="utf-8") as file:
+            json.dump(data, file)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+        postings = {}
+        for term, (encoded_docs, encoded_weights) in data["postings"].items():
+            docs, weights = array("i"), array("f")
+            docs.frombytes(base64.b64decode(encoded_docs))
+            weights.frombytes(base64.b64decode(encoded_weights))
+            postings[term] = (docs, weights)
+        return cls(data["ids"], data["documents"], data["metadatas"], postings)
+
+
+# Function to rebuild the lexical index from everything in a vector store
+def build_lexical_index(store, path):
+    """Build a BM25 index over all chunks in the store (Chroma collection or NumPy store) and save it."""
+    records = store.get(include=["documents", "metadatas"])
+    index = BM25Index.build(records["ids"], records["documents"], records["metadatas"])
+    index.save(path)
+    return index
+
+# Function to merge several rankings with reciprocal rank fusion
+def reciprocal_rank_fusion(rankings, k=3):
+    """Fuse lists of hits (best first) into one list, scoring 1 / (RRF_K + rank) per list."""
+    fused = {}
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking, start=1):
+            scores[hit["id"]] += 1.0 / (RRF_K + rank)
+            fused.setdefault(hit["id"], hit)
+    best = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [dict(fused[id_], score=scores[id_]) for id_ in best]
+
+
+class HybridRetriever:
+    """Retriever that fuses dense vector search with BM25 keyword search.
+
+    search() takes the query text as well as its embedding, so exact terms
+    such as dorm names, dates or policy numbers can match lexically even when
+    the embedding misses them.
+    """
+
+    def __init__(self, dense, lexical):
+        self.dense = dense
+        self.lexical = lexical
+
+    def count(self):
+        return self.dense.count()
+
+    def search(self, query_embedding, k=3, query_text=None):
+        dense_hits = self.dense.search(query_embedding, k=FUSION_CANDIDATES)
+        if not query_text or self.lexical is None:
+            return dense_hits[:k]
+        with metrics.span("lexical.search"):
+            lexical_hits = [self.lexical.hit(doc, score) for doc, score in self.lexical.search(query_text)]
+        return reciprocal_rank_fusion([dense_hits, lexical_hits], k=k)
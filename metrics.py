@@ -0,0 +1,159 @@
+import bisect
+import json
+import os
+import re
+import threading
+import time
+from contextlib import nullcontext
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Turned on with the APP_METRICS environment variable or configure(); off by default
+_enabled = os.environ.get("APP_METRICS", "").lower() in ("1", "true", "yes")
+_jsonl_path = os.environ.get("APP_METRICS_JSONL") or None
+_histograms = {}  # (span name, sorted label items) -> Histogram
+_collectors = {}  # name -> function returning a dict of current numbers (e.g. cache stats)
+_lock = threading.Lock()
+_NOOP = nullcontext()
+_LABEL_RE = re.compile(r"[^a-zA-Z0-9_]")
+
+
+class Histogram:
+    """Cumulative latency histogram for one span name and label set."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of the bucket that holds it."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class _Span:
+    __slots__ = ("name", "labels", "started")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        labels = dict(self.labels, error=exc_type.__name__) if exc_type is not None else self.labels
+        observe(self.name, time.perf_counter() - self.started, **labels)
+        return False
+
+
+# Function to turn metrics on or off, optionally also appending every observation to a JSONL file
+def configure(enabled=True, jsonl_path=None):
+    global _enabled, _jsonl_path
+    _enabled = enabled
+    _jsonl_path = jsonl_path
+
+def is_enabled():
+    return _enabled
+
+# Function to time a block: with span("rag.search"): ...
+def span(name, **labels):
+    """Return a context manager that records the block's duration under name.
+
+    When metrics are off this is a shared do-nothing context manager, so an
+    instrumented call costs one function call and no clock reads.
+    """
+    if not _enabled:
+        return _NOOP
+    return _Span(name, labels)
+
+# Function to record a duration measured elsewhere (e.g. time to first token)
+def observe(name, seconds, **labels):
+    if not _enabled or seconds is None:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(seconds)
+        if _jsonl_path:
+            with open(_jsonl_path, "a", encoding="utf-8") as file:
+                file.write(json.dumps({"ts": time.time(), "span": name, "seconds": seconds, **labels}) + "\n")
+
+# Function to report numbers kept elsewhere, such as cache hit rates, next to the latency histograms
+def register_stats(name, collect):
+    """Register collect(), which returns a dict of numbers, under name; registering a name again replaces it."""
+    with _lock:
+        _collectors[name] = collect
+
+def collected_stats():
+    """Return {name: stats dict} from every registered collector; a failing collector is left out."""
+    with _lock:
+        collectors = list(_collectors.items())
+    results = {}
+    for name, collect in collectors:
+        try:
+            results[name] = collect()
+        except Exception:
+            continue
+    return results
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+def snapshot():
+    """Return one summary dict per span name and label set, slowest total first."""
+    with _lock:
+        items = [(name, dict(labels), histogram) for (name, labels), histogram in _histograms.items()]
+        rows = [{
+            "span": name,
+            "labels": labels,
+            "count": histogram.count,
+            "mean": histogram.sum / histogram.count,
+            "p50": histogram.quantile(0.5),
+            "p95": histogram.quantile(0.95),
+            "total": histogram.sum,
+        } for name, labels, histogram in items]
+    return sorted(rows, key=lambda row: row["total"], reverse=True)
+
+def _label_text(labels, extra=()):
+    pairs = [(_LABEL_RE.sub("_", str(key)), str(value)) for key, value in list(labels) + list(extra)]
+    return "{" + ",".join(f'{key}="{json.dumps(value)[1:-1]}"' for key, value in pairs) + "}"
+
+# Function to render all histograms in the Prometheus text exposition format
+def prometheus_text(metric="app_span_seconds"):
+    lines = [f"# HELP {metric} Duration of instrumented spans.", f"# TYPE {metric} histogram"]
+    with _lock:
+        for (name, labels), histogram in sorted(_histograms.items(), key=lambda item: repr(item[0])):
+            base = (("span", name),) + labels
+            cumulative = 0
+            for bound, count in zip(BUCKETS + (float("inf"),), histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{metric}_bucket{_label_text(base, (('le', le),))} {cumulative}")
+            lines.append(f"{metric}_sum{_label_text(base)} {histogram.sum}")
+            lines.append(f"{metric}_count{_label_text(base)} {histogram.count}")
+    for name, stats in sorted(collected_stats().items()):
+        for stat, value in sorted(stats.items()):
+            if isinstance(value, (int, float)):
+                gauge = f"app_{_LABEL_RE.sub('_', name)}_{_LABEL_RE.sub('_', stat)}"
+                lines.append(f"# TYPE {gauge} gauge")
+                lines.append(f"{gauge} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,120 @@
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from PyPDF2 import PdfReader
+
+try:
+    import fitz  # PyMuPDF, much faster than PyPDF2
+except ImportError:
+    fitz = None
+
+PDF_TEXT_CACHE_DIRECTORY = os.path.join(os.getcwd(), ".pdf_text_cache")
+
+# Documents shorter than this many pages per worker are extracted in-process
+MIN_PAGES_PER_WORKER = 16
+MAX_WORKERS = max(1, min(4, os.cpu_count() or 1))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def default_backend():
+    return "pymupdf" if fitz is not None else "pypdf2"
+
+# Function to open a PDF given either its path or its bytes
+def _open(source, backend):
+    if backend == "pymupdf":
+        if isinstance(source, (bytes, bytearray)):
+            return fitz.open(stream=source, filetype="pdf")
+        return fitz.open(source)
+    if backend == "pypdf2":
+        return PdfReader(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+    raise ValueError(f"Unknown PDF backend: {backend}")
+
+def _page_count(document, backend):
+    return document.page_count if backend == "pymupdf" else len(document.pages)
+
+# Function run in worker processes: extract one range of pages
+def _extract_range(source, backend, start, end):
+    document = _open(source, backend)
+    if backend == "pymupdf":
+        with document:
+            return [document[i].get_text() for i in range(start, end)]
+    return [document.pages[i].extract_text() or '' for i in range(start, end)]
+
+def _get_pool():
+    # One long-lived pool per process; spawned workers are safe to start from Streamlit's threads
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=MAX_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+# Function to extract page texts, splitting long documents across worker processes
+def extract_pages_uncached(source, backend=None, workers=None):
+    """Return the text of each page of a PDF given as a path or as bytes."""
+    backend = backend or default_backend()
+    workers = MAX_WORKERS if workers is None else workers
+    document = _open(source, backend)
+    page_count = _page_count(document, backend)
+
+    if workers <= 1 or page_count < 2 * MIN_PAGES_PER_WORKER:
+        if backend == "pymupdf":
+            with document:
+                return [page.get_text() for page in document]
+        return [page.extract_text() or '' for page in document.pages]
+    if backend == "pymupdf":
+        document.close()
+
+    parts = min(workers, page_count // MIN_PAGES_PER_WORKER)
+    bounds = [page_count * i // parts for i in range(parts + 1)]
+    pool = _get_pool()
+    futures = [pool.submit(_extract_range, source, backend, bounds[i], bounds[i + 1]) for i in range(parts)]
+    pages = []
+    for future in futures:
+        pages.extend(future.result())
+    return pages
+
+# Function to extract page texts, reusing earlier results for identical files
+def extract_pages(source, backend=None, sha256=None, cache_dir=PDF_TEXT_CACHE_DIRECTORY):
+    """Return the text of each page, cached on disk by content hash and backend.
+
+    source is a file path or the PDF's bytes. Pass sha256 if the caller has
+    already hashed the file; cache_dir=None disables the cache.
+    """
+    backend = backend or default_backend()
+    if cache_dir is None:
+        return extract_pages_uncached(source, backend)
+
+    if sha256 is None:
+        if isinstance(source, (bytes, bytearray)):
+            sha256 = hashlib.sha256(source).hexdigest()
+        else:
+            digest = hashlib.sha256()
+            with open(source, "rb") as file:
+                for block in iter(lambda: file.read(1 << 20), b""):
+                    digest.update(block)
+            sha256 = digest.hexdigest()
+    cache_path = os.path.join(cache_dir, f"{sha256}-{backend}.json")
+    try:
+        with open(cache_path, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        pass
+
+    pages = extract_pages_uncached(source, backend)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(pages, file)
+    os.replace(tmp_path, cache_path)
+    return pages
+
+# Function to extract a PDF's full text
+def extract_text(source, backend=None, cache_dir=PDF_TEXT_CACHE_DIRECTORY):
+    return "".join(extract_pages(source, backend, cache_dir=cache_dir))
@@ -0,0 +1,413 @@
+import asyncio
+import hashlib
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import ledger
+import metrics
+from chat_memory import get_chat_encoding
+
+logger = logging.getLogger(__name__)
+
+# Most streams one provider may have open at once in this process; later calls wait their turn
+MAX_CONCURRENT_STREAMS = 64
+
+# How long a key check is trusted: working keys for an hour, rejected keys for five minutes
+KEY_VALID_TTL_SECONDS = 60 * 60
+KEY_INVALID_TTL_SECONDS = 5 * 60
+
+# Most provider clients and key check results kept per process; the least recently used go first
+MAX_PROVIDERS = 16
+MAX_KEY_CHECKS = 256
+
+_loop = None
+_loop_lock = threading.Lock()
+_providers = OrderedDict()  # (provider name, sha256 of key) -> Provider
+_providers_lock = threading.Lock()
+_key_checks = OrderedDict()  # (provider name, sha256 of key) -> (is_valid, message, expires_at)
+_key_checks_lock = threading.Lock()
+# One thread counts the tokens of finished streams and writes them to the ledger, in order
+_accounting = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ledger")
+
+
+# Function to get the process-wide event loop that all provider calls run on
+def get_event_loop():
+    """Start (once) and return an asyncio loop running on a daemon thread.
+
+    The async SDK clients keep their connection pools on this loop, so they
+    must always be used from it; synchronous code reaches it through
+    TokenStream or asyncio.run_coroutine_threadsafe.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="provider-loop", daemon=True).start()
+            _loop = loop
+        return _loop
+
+# Function to run a coroutine on the shared loop and wait for its result
+def run_sync(coroutine):
+    return asyncio.run_coroutine_threadsafe(coroutine, get_event_loop()).result()
+
+
+# Function to estimate the prompt tokens of a chat when the provider does not report them
+def count_prompt_tokens(messages, encoding=None):
+    encoding = encoding or get_chat_encoding()
+    # About 4 tokens of role and separators per message, as in OpenAI's chat format
+    return sum(len(encoding.encode(str(message.get("content", "")))) + 4 for message in messages)
+
+
+class TokenStream:
+    """Synchronous iterator over a provider's async token stream.
+
+    One task on the shared event loop drains the async stream into a
+    thread-safe queue, and the caller's thread reads text deltas from it, so
+    Streamlit code can render tokens with a plain for loop. stats holds the
+    timing once the stream has finished.
+    """
+
+    _DONE = object()
+
+    def __init__(self, agen, stats):
+        self.stats = stats
+        self._agen = agen
+
+    async def _pump(self, items):
+        try:
+            async for text in self._agen:
+                items.put(text)
+        except Exception as e:
+            items.put(e)
+        items.put(self._DONE)
+
+    def __iter__(self):
+        items = queue.SimpleQueue()
+        future = asyncio.run_coroutine_threadsafe(self._pump(items), get_event_loop())
+        try:
+            while True:
+                item = items.get()
+                if item is self._DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Also runs when the caller stops early; cancelling closes the HTTP stream
+            future.cancel()
+
+
+class Provider:
+    """One LLM provider behind a common interface.
+
+    Subclasses create their async SDK client once, in __init__, and implement
+    _raw_stream(), which yields text deltas for a list of
+    {"role", "content"} messages and fills usage with the token counts the
+    provider reports. astream() adds timing on top (time to first token,
+    total time and tokens per second) and records every call in the token
+    ledger.
+
+    All streams run as coroutines on the shared event loop and share one
+    pooled async client per key. At most max_concurrency streams per
+    provider are open at once; the rest queue on a semaphore. A synchronous
+    caller reading a TokenStream still blocks its own thread until the
+    answer ends.
+    """
+
+    name = None
+    default_model = None
+    max_concurrency = MAX_CONCURRENT_STREAMS
+    _semaphore = None
+
+    def semaphore(self):
+        # Only called from the event loop thread, so creating it lazily is safe
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _raw_stream(self, messages, model, max_tokens, temperature, usage):
+        raise NotImplementedError
+        yield
+
+    async def astream(self, messages, model=None, max_tokens=1500, temperature=0, stats=None, context=None):
+        """Yield the answer to messages as text deltas, filling stats as it goes.
+
+        context is the ledger context (session, page) the call is billed to.
+        """
+        model = model or self.default_model
+        stats = {} if stats is None else stats
+        stats.update(provider=self.name, model=model, ttft=None)
+        started = time.perf_counter()
+        parts = []
+        usage = {}
+        try:
+            async with self.semaphore():
+                stats["queued"] = time.perf_counter() - started
+                async for text in self._raw_stream(messages, model, max_tokens, temperature, usage):
+                    if not text:
+                        continue
+                    if stats["ttft"] is None:
+                        stats["ttft"] = time.perf_counter() - started
+                    parts.append(text)
+                    yield text
+        finally:
+            seconds = time.perf_counter() - started
+            stats["seconds"] = seconds
+            metrics.observe("llm.queued", stats.get("queued"), provider=self.name, model=model)
+            metrics.observe("llm.ttft", stats["ttft"], provider=self.name, model=model)
+            metrics.observe("llm.stream", seconds, provider=self.name, model=model)
+            # Token counting and the SQLite write would stall every other stream on this loop, so they run
+            # on the accounting thread
+            _accounting.submit(self._account, messages, model, parts, usage, stats, context)
+
+    def _account(self, messages, model, parts, usage, stats, context):
+        """Fill in the token counts of a finished stream and record it in the ledger."""
+        try:
+            # Prefer the provider's own counts; a stream closed early never gets them, so count with tiktoken
+            tokens = usage.get("completion_tokens")
+            prompt_tokens = usage.get("prompt_tokens")
+            stats["usage_source"] = "usage" if tokens is not None and prompt_tokens is not None else "estimate"
+            if tokens is None:
+                tokens = len(get_chat_encoding().encode("".join(parts)))
+            if prompt_tokens is None:
+                prompt_tokens = count_prompt_tokens(messages)
+            generating = stats["seconds"] - (stats["ttft"] or 0.0)
+            stats.update(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=tokens,
+                tokens_per_second=tokens / generating if generating > 0 else 0.0,
+            )
+            ledger.get_ledger().record(
+                self.name, model, prompt_tokens, tokens, stats["usage_source"],
+                context=context, seconds=stats["seconds"], ttft=stats["ttft"],
+                prompt_preview=messages[-1]["content"] if messages else None,
+            )
+            logger.info("%s %s: first token %.2fs, %d tokens in %.2fs",
+                        self.name, model, stats["ttft"] or 0.0, tokens, stats["seconds"])
+        except Exception as e:
+            logger.warning("Could not record %s usage in the token ledger: %s", self.name, e)
+
+    def stream(self, messages, model=None, max_tokens=1500, temperature=0, context=None):
+        """Synchronous version of astream(); returns a TokenStream.
+
+        context is the ledger context to bill; it defaults to the calling
+        thread's, so code that calls from a worker thread must pass the
+        context it read on the script thread. Raises ledger.BudgetExceeded
+        when that session has used its token budget.
+        """
+        context = context or ledger.current_context()
+        ledger.check_budget(context)
+        stats = {}
+        return TokenStream(self.astream(messages, model, max_tokens, temperature, stats, context), stats)
+
+    def complete(self, messages, model=None, max_tokens=1500, temperature=0, context=None):
+        """Return the whole answer as one string."""
+        return "".join(self.stream(messages, model, max_tokens, temperature, context))
+
+    def validate(self):
+        """Raise if the API key does not work."""
+        self.complete([{"role": "user", "content": "Hello"}], max_tokens=5)
+
+    def close(self):
+        """Release the client's connections."""
+
+    @classmethod
+    def check_key(cls, api_key):
+        """Raise if api_key does not work, using a client that is closed straight after."""
+        provider = cls(api_key)
+        try:
+            provider.validate()
+        finally:
+            provider.close()
+
+
+class OpenAIProvider(Provider):
+    name = "openai"
+    default_model = "gpt-4o-mini"
+
+    def __init__(self, api_key):
+        from openai import AsyncOpenAI
+        self.client = AsyncOpenAI(api_key=api_key)
+
+    async def _raw_stream(self, messages, model, max_tokens, temperature, usage):
+        stream = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+            stream_options={"include_usage": True},  # The last chunk then carries the token counts
+        )
+        async for chunk in stream:
+            if chunk.usage:
+                usage.update(prompt_tokens=chunk.usage.prompt_tokens, completion_tokens=chunk.usage.completion_tokens)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def _list_models(self):
+        return await self.client.models.list()
+
+    def validate(self):
+        run_sync(self._list_models())
+
+    def close(self):
+        run_sync(self.client.close())
+
+
+class CohereProvider(Provider):
+    name = "cohere"
+    default_model = "command-r"
+    ROLES = {"user": "USER", "assistant": "CHATBOT", "system": "SYSTEM"}
+
+    def __init__(self, api_key):
+        import cohere
+        self.client = cohere.AsyncClient(api_key)
+
+    async def _raw_stream(self, messages, model, max_tokens, temperature, usage):
+        events = self.client.chat_stream(
+            model=model,
+            message=messages[-1]["content"],
+            chat_history=[{"role": self.ROLES.get(m["role"], "USER"), "message": m["content"]} for m in messages[:-1]],
+            temperature=temperature,
+            max_tokens=max_tokens,
+        )
+        async for event in events:
+            if event.event_type == "text-generation":
+                yield event.text
+            elif event.event_type == "stream-end":
+                meta = getattr(event.response, "meta", None)
+                billed = getattr(meta, "billed_units", None)
+                if billed is not None:
+                    usage.update(prompt_tokens=billed.input_tokens, completion_tokens=billed.output_tokens)
+
+    async def _close(self):
+        await self.client.__aexit__(None, None, None)
+
+    def close(self):
+        run_sync(self._close())
+
+
+class GeminiProvider(Provider):
+    name = "gemini"
+    default_model = "gemini-pro"
+
+    def __init__(self, api_key):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self.genai = genai
+        self.models = {}  # model name -> GenerativeModel
+
+    async def _raw_stream(self, messages, model, max_tokens, temperature, usage):
+        if model not in self.models:
+            self.models[model] = self.genai.GenerativeModel(model)
+        contents = [
+            {"role": "user" if m["role"] == "user" else "model", "parts": [{"text": m["content"]}]}
+            for m in messages
+        ]
+        response = await self.models[model].generate_content_async(
+            contents,
+            generation_config=self.genai.types.GenerationConfig(temperature=temperature, max_output_tokens=max_tokens),
+            stream=True,
+        )
+        async for chunk in response:
+            # Every chunk repeats the running totals; the last one has the final counts
+            metadata = getattr(chunk, "usage_metadata", None)
+            if metadata is not None and metadata.prompt_token_count:
+                usage.update(prompt_tokens=metadata.prompt_token_count,
+                             completion_tokens=metadata.candidates_token_count)
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunks without text (e.g. safety metadata) carry nothing to show
+                continue
+            yield text
+
+    def validate(self):
+        # Gemini keys were never checked with a request; configuring the client is enough
+        pass
+
+    @classmethod
+    def check_key(cls, api_key):
+        # Nothing to check, and creating a provider would reconfigure the genai module for everyone
+        pass
+
+
+PROVIDERS = {
+    "openai": OpenAIProvider,
+    "cohere": CohereProvider,
+    "gemini": GeminiProvider,
+}
+
+
+def _key_hash(api_key):
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+# Function to get the long-lived provider for a name and API key
+def get_provider(name, api_key):
+    """Return the provider for name ("openai", "cohere" or "gemini"), created once per key and process.
+
+    Clients are keyed by a hash of the key, and only the MAX_PROVIDERS most
+    recently used are kept.
+    """
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown LLM provider: {name}")
+    cache_key = (name, _key_hash(api_key))
+    with _providers_lock:
+        provider = _providers.get(cache_key)
+        if provider is None:
+            provider = PROVIDERS[name](api_key)
+            _providers[cache_key] = provider
+            while len(_providers) > MAX_PROVIDERS:
+                # Streams still using an evicted client keep it alive until they finish
+                _providers.popitem(last=False)
+        _providers.move_to_end(cache_key)
+        return provider
+
+
+def _is_auth_error(error):
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    return status in (401, 403)
+
+# Function to check an API key once and remember the answer, instead of on every rerun
+def check_api_key(name, api_key):
+    """Return (is_valid, message) for a provider's API key.
+
+    Results are cached per provider and key hash, so a rerun costs no network
+    round-trip. A key is only reported invalid when the provider rejects it
+    (401/403). Other failures, such as a timeout, let the key through
+    uncached; a bad key then fails on its first real request instead.
+
+    Keys typed by visitors are checked with a short-lived client, so neither
+    the key nor a connection pool outlives the check.
+    """
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown LLM provider: {name}")
+    cache_key = (name, _key_hash(api_key))
+    with _key_checks_lock:
+        cached = _key_checks.get(cache_key)
+    if cached is not None and cached[2] > time.time():
+        return cached[0], cached[1]
+
+    with _providers_lock:
+        provider = _providers.get(cache_key)
+    try:
+        if provider is not None:
+            provider.validate()  # Already open for this key; no need for a second client
+        else:
+            PROVIDERS[name].check_key(api_key)
+        result = (True, "API key is valid", time.time() + KEY_VALID_TTL_SECONDS)
+    except Exception as e:
+        if not _is_auth_error(e):
+            logger.warning("Could not check the %s API key (%s); deferring to the first request", name, e)
+            return True, f"API key not verified yet: {e}"
+        result = (False, str(e), time.time() + KEY_INVALID_TTL_SECONDS)
+    with _key_checks_lock:
+        _key_checks[cache_key] = result
+        _key_checks.move_to_end(cache_key)
+        while len(_key_checks) > MAX_KEY_CHECKS:
+            _key_checks.popitem(last=False)
+    return result[0], result[1]
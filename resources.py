@@ -0,0 +1,163 @@
+import logging
+import os
+import threading
+import time
+
+import streamlit as st
+from openai import OpenAI
+
+import metrics
+from answer_cache import ANSWER_CACHE_THRESHOLD, SemanticAnswerCache
+from embeddings import QueryEmbeddingCache, embed_query
+from ingestion import MANIFEST_FILENAME, sync_pdf_directory
+from lexical import LEXICAL_INDEX_FILENAME, BM25Index, HybridRetriever, build_lexical_index
+from providers import get_provider
+from retrievers import ChromaRetriever, NumpyVectorStore
+
+logger = logging.getLogger(__name__)
+
+# Locations of the vector stores and the PDFs they are built from
+PERSIST_DIRECTORY = os.path.join(os.getcwd(), "chroma_db")
+NUMPY_INDEX_DIRECTORY = os.path.join(os.getcwd(), "numpy_index")
+PDF_DIRECTORY = os.path.join(os.getcwd(), "Lab4_datafiles")
+COLLECTION_NAME = "Lab4Collection"
+
+# Vector backend used when secrets do not set vector_backend ("chroma" or "numpy")
+DEFAULT_VECTOR_BACKEND = "chroma"
+
+# The query embedding cache does not depend on the vector backend, so it has a directory of its own
+QUERY_CACHE_PATH = os.path.join(os.getcwd(), ".query_cache", "query_embeddings.sqlite3")
+
+# Only one session at a time may write to the collection
+_sync_lock = threading.Lock()
+
+
+# These objects live once per server process and are shared by every browser
+# session. st.cache_resource builds each one under a lock the first time it is
+# requested and hands the same instance to all later callers. The cache keys
+# include the API key and a fingerprint of the data directory, so editing the
+# secrets or the PDFs makes the next request build a fresh instance.
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _openai_client(api_key):
+    return OpenAI(api_key=api_key)
+
+@st.cache_resource(show_spinner=False)
+def _chroma_client(persist_directory):
+    # chromadb is only imported when the Chroma backend is used, since the
+    # import alone is slow. Workaround for sqlite3 issue in Streamlit Cloud:
+    __import__('pysqlite3')
+    import sys
+    sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
+
+    import chromadb
+    return chromadb.PersistentClient(path=persist_directory)
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _lab4_collection(backend, pdf_dir, api_key, data_fingerprint):
+    if backend == "numpy":
+        store_directory = NUMPY_INDEX_DIRECTORY
+        store = NumpyVectorStore(store_directory)
+        retriever = store
+    elif backend == "chroma":
+        store_directory = PERSIST_DIRECTORY
+        store = _chroma_client(store_directory).get_or_create_collection(COLLECTION_NAME)
+        retriever = ChromaRetriever(store)
+    else:
+        raise ValueError(f"Unknown vector_backend: {backend}")
+
+    manifest_path = os.path.join(store_directory, MANIFEST_FILENAME)
+    lexical_path = os.path.join(store_directory, LEXICAL_INDEX_FILENAME)
+    with _sync_lock:
+        report = sync_pdf_directory(store, _openai_client(api_key), pdf_dir, manifest_path)
+
+        # Keep the BM25 index next to the vectors, rebuilding it only when the chunks changed
+        lexical_index = None
+        if not (report["indexed"] or report["removed"]) and os.path.exists(lexical_path):
+            try:
+                lexical_index = BM25Index.load(lexical_path)
+            except (OSError, ValueError, KeyError):
+                lexical_index = None
+        if lexical_index is None:
+            lexical_index = build_lexical_index(store, lexical_path)
+    return HybridRetriever(retriever, lexical_index), report
+
+@st.cache_resource(show_spinner=False)
+def _query_cache(db_path):
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    return QueryEmbeddingCache(db_path=db_path)
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _answer_cache(threshold):
+    return SemanticAnswerCache(threshold=threshold)
+
+# Function to fingerprint the PDFs on disk without reading them
+def data_directory_fingerprint(pdf_dir):
+    fingerprint = []
+    for filename in sorted(os.listdir(pdf_dir)):
+        if filename.endswith(".pdf"):
+            stat = os.stat(os.path.join(pdf_dir, filename))
+            fingerprint.append((filename, stat.st_size, stat.st_mtime_ns))
+    return tuple(fingerprint)
+
+def get_openai_client():
+    """Return the process-wide OpenAI client for the key in Streamlit secrets."""
+    return _openai_client(st.secrets["openai"])
+
+def get_chat_provider():
+    """Return the process-wide async OpenAI chat provider; its streams share one event loop."""
+    return get_provider("openai", st.secrets["openai"])
+
+def get_vector_backend():
+    return st.secrets.get("vector_backend", DEFAULT_VECTOR_BACKEND)
+
+def get_lab4_collection():
+    """Return the shared (retriever, sync report), or (None, None) if the PDF directory is missing.
+
+    The retriever fuses BM25 keyword search with vector search over the
+    Chroma collection or the local NumPy index, depending on the
+    vector_backend secret.
+    """
+    if not os.path.exists(PDF_DIRECTORY):
+        return None, None
+    collection, report = _lab4_collection(
+        get_vector_backend(), PDF_DIRECTORY, st.secrets["openai"], data_directory_fingerprint(PDF_DIRECTORY)
+    )
+    if report["retry_at"] is not None and time.time() >= report["retry_at"]:
+        # A file that failed is due another try; the next sync skips everything that is unchanged
+        _lab4_collection.clear()
+    return collection, report
+
+def get_query_cache():
+    """Return the process-wide query embedding cache (persisted in .query_cache)."""
+    return _query_cache(QUERY_CACHE_PATH)
+
+def get_query_embedding(query):
+    """Embed a user question, reusing cached embeddings of earlier identical questions."""
+    return embed_query(get_openai_client(), query, get_query_cache())
+
+def get_answer_cache():
+    """Return the process-wide answer cache; secrets may set answer_cache_threshold."""
+    return _answer_cache(float(st.secrets.get("answer_cache_threshold", ANSWER_CACHE_THRESHOLD)))
+
+def get_corpus_hash():
+    """Return the hash of the indexed corpus, or None if it is unavailable."""
+    _, report = get_lab4_collection()
+    return report["corpus_hash"] if report else None
+
+# Report the hit rates of both caches with the latency metrics (admin panel and Prometheus text)
+metrics.register_stats("query_embedding_cache", lambda: get_query_cache().stats())
+metrics.register_stats("answer_cache", lambda: get_answer_cache().stats())
+
+def warm_up():
+    """Build the shared clients so sessions find them ready.
+
+    The document collection is left to the pages, which show a spinner while
+    the first sync runs. A failure here is only logged; each page reports it
+    when it needs the resource.
+    """
+    try:
+        get_openai_client()
+        get_query_cache()
+    except Exception as e:
+        logger.warning("Could not warm up the shared clients: %s", e)
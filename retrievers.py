@@ -0,0 +1,176 @@
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+RECORDS_FILENAME = "records.json"
+
+# A retriever is any object with search(query_embedding, k, query_text=None)
+# returning a list of hits, best first. Each hit is a dict with "id", "text",
+# "metadata" and "score" (higher is better). Retrievers that do not use the
+# query text simply ignore it. query_vector_db only talks to this interface, so
+# the backend can be swapped without touching the pages.
+
+
+class ChromaRetriever:
+    """Retriever over a Chroma collection."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def count(self):
+        return self.collection.count()
+
+    def search(self, query_embedding, k=3, query_text=None):
+        with metrics.span("vector.search", backend="chroma"):
+            results = self.collection.query(query_embeddings=[query_embedding], n_results=k)
+        distances = (results.get("distances") or [[None] * len(results["ids"][0])])[0]
+        return [
+            {"id": id_, "text": text, "metadata": metadata, "score": -distance if distance is not None else None}
+            for id_, text, metadata, distance in zip(
+                results["ids"][0], results["documents"][0], results["metadatas"][0], distances
+            )
+        ]
+
+
+class NumpyVectorStore:
+    """In-process vector index kept in a memory-mapped float32 matrix.
+
+    Embeddings are L2-normalized on insert and stored row by row in a
+    versioned embeddings-<n>.f32; ids, texts, metadata and the name of that
+    file live alongside in records.json.
+    A top-k query is a single matrix-vector product over the mapped matrix.
+    The write methods mirror the Chroma collection API used by the
+    ingestion stage (count, add, delete by filename), so the store can be
+    synced exactly like a collection, and get() returns every record the way
+    collection.get() does. A write creates a new embeddings file and then
+    replaces records.json, the single commit point, so a crash leaves the
+    previous snapshot intact; readers keep using it until the swap.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        empty = {"version": 0, "dim": 0, "ids": [], "documents": [], "metadatas": []}
+        try:
+            with open(os.path.join(self.directory, RECORDS_FILENAME), "r", encoding="utf-8") as file:
+                records = json.load(file)
+        except (OSError, ValueError):
+            records = empty
+        matrix = np.zeros((0, records["dim"]), dtype=np.float32)
+        if records["ids"]:
+            embeddings_path = os.path.join(self.directory, records["embeddings_file"])
+            expected = len(records["ids"]) * records["dim"] * np.dtype(np.float32).itemsize
+            try:
+                size = os.path.getsize(embeddings_path)
+            except OSError:
+                size = None
+            if size == expected:
+                matrix = np.memmap(embeddings_path, dtype=np.float32, mode="r",
+                                   shape=(len(records["ids"]), records["dim"]))
+            else:
+                # Vectors that do not match the records would be paired with the wrong chunks;
+                # start empty so the next sync re-indexes everything
+                logger.warning("Vector index in %s is inconsistent (%s bytes, expected %d); starting empty",
+                               self.directory, size, expected)
+                records = empty
+                matrix = np.zeros((0, 0), dtype=np.float32)
+        # Swap in the new snapshot in one assignment so readers never see a mix
+        self._snapshot = (matrix, records)
+
+    def _write(self, matrix, records):
+        version = self._snapshot[1].get("version", 0) + 1
+        embeddings_file = f"embeddings-{version}.f32"
+        records = dict(records, version=version, embeddings_file=embeddings_file)
+        records_path = os.path.join(self.directory, RECORDS_FILENAME)
+        np.ascontiguousarray(matrix, dtype=np.float32).tofile(os.path.join(self.directory, embeddings_file))
+        with open(records_path + ".tmp", "w", encoding="utf-8") as file:
+            json.dump(records, file)
+        os.replace(records_path + ".tmp", records_path)
+        self._load()
+        # Older embeddings files are no longer referenced; open maps of them stay valid on POSIX
+        for name in os.listdir(self.directory):
+            if name.endswith(".f32") and name != embeddings_file:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def count(self):
+        return len(self._snapshot[1]["ids"])
+
+    def add(self, documents, metadatas, ids, embeddings):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1.0, norms)
+        with self._lock:
+            matrix, records = self._snapshot
+            if records["ids"] and vectors.shape[1] != records["dim"]:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match index dimension {records['dim']}")
+            # Adding an existing id replaces it, like Chroma's upsert
+            new_ids = set(ids)
+            keep = [i for i, id_ in enumerate(records["ids"]) if id_ not in new_ids]
+            records = {
+                "dim": int(vectors.shape[1]),
+                "ids": [records["ids"][i] for i in keep] + list(ids),
+                "documents": [records["documents"][i] for i in keep] + list(documents),
+                "metadatas": [records["metadatas"][i] for i in keep] + list(metadatas),
+            }
+            self._write(np.concatenate([np.asarray(matrix)[keep], vectors]) if keep else vectors, records)
+
+    def delete(self, ids=None, where=None):
+        with self._lock:
+            matrix, records = self._snapshot
+            drop = set()
+            for i, (id_, metadata) in enumerate(zip(records["ids"], records["metadatas"])):
+                if ids is not None and id_ in ids:
+                    drop.add(i)
+                elif where and all(metadata.get(key) == value for key, value in where.items()):
+                    drop.add(i)
+            if not drop:
+                return
+            keep = [i for i in range(len(records["ids"])) if i not in drop]
+            records = {
+                "dim": records["dim"],
+                "ids": [records["ids"][i] for i in keep],
+                "documents": [records["documents"][i] for i in keep],
+                "metadatas": [records["metadatas"][i] for i in keep],
+            }
+            self._write(np.asarray(matrix)[keep], records)
+
+    def get(self, include=None):
+        """Return every stored record, shaped like Chroma's collection.get()."""
+        records = self._snapshot[1]
+        return {"ids": list(records["ids"]), "documents": list(records["documents"]),
+                "metadatas": list(records["metadatas"])}
+
+    def search(self, query_embedding, k=3, query_text=None):
+        matrix, records = self._snapshot
+        if not records["ids"]:
+            return []
+        with metrics.span("vector.search", backend="numpy"):
+            query = np.asarray(query_embedding, dtype=np.float32)
+            query /= np.linalg.norm(query) or 1.0
+            scores = matrix @ query
+            k = min(k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+        return [
+            {
+                "id": records["ids"][i],
+                "text": records["documents"][i],
+                "metadata": records["metadatas"][i],
+                "score": float(scores[i]),
+            }
+            for i in top
+        ]
@@ -0,0 +1,64 @@
+import time
+
+import metrics
+
+# Redraw a streaming answer at most this often, or once this many pieces are waiting
+FLUSH_INTERVAL_SECONDS = 0.05
+FLUSH_EVERY_TOKENS = 32
+CURSOR = "▌"
+
+
+class StreamRenderer:
+    """Shows a streamed answer in a Streamlit placeholder without redrawing it per token.
+
+    Every placeholder.markdown() call sends the whole answer so far to the
+    browser, so redrawing per token costs O(n^2) bytes. write() only buffers
+    the piece; the placeholder is redrawn when interval seconds have passed
+    or max_pending pieces are waiting, and close() draws the final text
+    without the cursor. The first piece is drawn immediately.
+    """
+
+    def __init__(self, placeholder, interval=FLUSH_INTERVAL_SECONDS, max_pending=FLUSH_EVERY_TOKENS, cursor=CURSOR):
+        self.placeholder = placeholder
+        self.interval = interval
+        self.max_pending = max_pending
+        self.cursor = cursor
+        self.parts = []  # every piece received, in order
+        self.flushes = 0
+        self._text = ""
+        self._flushed_parts = 0
+        self._last_flush = None
+
+    @property
+    def text(self):
+        self._join()
+        return self._text
+
+    def _join(self):
+        if self._flushed_parts < len(self.parts):
+            self._text += "".join(self.parts[self._flushed_parts:])
+            self._flushed_parts = len(self.parts)
+
+    def write(self, piece):
+        if not piece:
+            return
+        self.parts.append(piece)
+        now = time.perf_counter()
+        if (self._last_flush is None or now - self._last_flush >= self.interval
+                or len(self.parts) - self._flushed_parts >= self.max_pending):
+            self.flush(now)
+
+    def flush(self, now=None):
+        self._join()
+        with metrics.span("render.redraw"):
+            self.placeholder.markdown(self._text + self.cursor)
+        self.flushes += 1
+        self._last_flush = time.perf_counter() if now is None else now
+
+    def close(self):
+        """Draw the complete answer and return its text."""
+        self._join()
+        with metrics.span("render.redraw"):
+            self.placeholder.markdown(self._text)
+        self.flushes += 1
+        return self._text
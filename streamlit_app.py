@@ -1,6 +1,13 @@
+import importlib
+import uuid
+
 import streamlit as st
 from streamlit_option_menu import option_menu
 
+import ledger
+import metrics
+from resources import warm_up
+
 # Set up the main page configuration
 st.set_page_config(
     page_title="Pre-College Chatbot",
@@ -8,35 +15,90 @@ st.set_page_config(
     layout="wide"
 )
 
-# Define navigation with a single active page
+# Per-stage timing is off unless secrets (or the APP_METRICS environment variable) turn it on;
+# metrics_jsonl also appends every timing to that file
+if st.secrets.get("metrics_enabled"):
+    metrics.configure(True, st.secrets.get("metrics_jsonl"))
+
+# Build the shared OpenAI client and query cache. Only the first session
+# after the server starts does real work here; later sessions and reruns get
+# the cached, process-wide instances. The document collection is built by the
+# page that needs it, behind its own spinner.
+warm_up()
+
+# Pages shown in the menu: (menu label, icon, module with a render() function).
+# Each module is imported on first use and then stays loaded for the whole
+# process, so reruns only call render() instead of re-reading and exec'ing the file.
+# Whatever a page defines at module level is built once; render() runs on every rerun.
+PAGES = [
+    ("Final Testing Bot", "beaker", "cps5"),
+    # Commented out all other pages
+    # ("Test Bot", "file-earmark-text", "cps1"),
+    # ("Pre-College Bot", "link-45deg", "cps2"),
+    # ("Smart Pre-College Bot", "chat-dots", "cps3"),
+    # ("SRC Pre-College Bot", "search", "cps4"),
+]
+
+# Define navigation from the registered pages
 with st.sidebar:
     selected_page = option_menu(
         "Pre College Bot",
-        ["Final Testing Bot"],  # Only one option
-        icons=['beaker'],  # Single icon
+        [label for label, _, _ in PAGES],
+        icons=[icon for _, icon, _ in PAGES],
         menu_icon="cast",
-        default_index=0,  # Default to this page
+        default_index=0,  # Default to the first page
     )
 
-# Only the "Final Testing Bot" is active
-if selected_page == "Final Testing Bot":
-    st.title("Syracuse University Office of Pre-College Programs")
-    # Execute the cps5.py code
-    exec(open("cps5.py").read())  # This will run the content of cps5.py
+# Function to show the latency histograms of this process in the sidebar (secrets: metrics_admin = true)
+def render_metrics_panel():
+    with st.sidebar.expander("Latency metrics"):
+        rows = metrics.snapshot()
+        if not rows:
+            st.caption("No timings recorded yet.")
+        else:
+            st.dataframe([{
+                "span": row["span"] + "".join(f" {key}={value}" for key, value in row["labels"].items()),
+                "count": row["count"],
+                "mean ms": round(row["mean"] * 1000, 1),
+                "p50 ms": round(row["p50"] * 1000, 1),
+                "p95 ms": round(row["p95"] * 1000, 1),
+            } for row in rows], hide_index=True)
+        cache_stats = metrics.collected_stats()
+        if cache_stats:
+            st.caption("Caches")
+            st.dataframe([dict(cache=name, **stats) for name, stats in cache_stats.items()], hide_index=True)
+        st.download_button("Prometheus metrics", metrics.prometheus_text(), file_name="metrics.txt")
+        if st.button("Reset metrics"):
+            metrics.reset()
+
+# Function to show this session's token use against its budget
+def render_token_budget():
+    used, budget = ledger.session_budget()
+    st.sidebar.progress(min(1.0, used / budget), text=f"Tokens this session: {used:,} of {budget:,}")
+
+# Function to show where tokens and money go, across all sessions (secrets: ledger_admin = true)
+def render_ledger_panel():
+    with st.sidebar.expander("Token usage"):
+        token_ledger = ledger.get_ledger()
+        group = st.selectbox("Group by", ["model", "page", "session"])
+        st.dataframe(token_ledger.summary(group_by=(group,)), hide_index=True)
+        st.caption("Largest prompts")
+        st.dataframe(token_ledger.top_prompts(), hide_index=True)
 
-# Commented out all other pages
-# elif selected_page == "Test Bot":
-#     st.title("SU Office of Pre-College Programs")
-#     exec(open("cps1.py").read())  # Run cps1.py
+if metrics.is_enabled() and st.secrets.get("metrics_admin"):
+    render_metrics_panel()
 
-# elif selected_page == "Pre-College Bot":
-#     st.title("Syracuse University Office of Pre-College Programs")
-#     exec(open("cps2.py").read())  # Run cps2.py
+# Every LLM call made while drawing the page is billed to this session and page in the token ledger
+if "ledger_session" not in st.session_state:
+    st.session_state.ledger_session = uuid.uuid4().hex
 
-# elif selected_page == "Smart Pre-College Bot":
-#     st.title("Syracuse University Office of Pre-College Programs")
-#     exec(open("cps3.py").read())  # Run cps3.py
+for label, _, module_name in PAGES:
+    if selected_page == label:
+        ledger.set_context(st.session_state.ledger_session, module_name,
+                           st.secrets.get("session_token_budget", ledger.SESSION_TOKEN_BUDGET))
+        st.title("Syracuse University Office of Pre-College Programs")
+        importlib.import_module(module_name).render()
 
-# elif selected_page == "SRC Pre-College Bot":
-#     st.title("Syracuse University Office of Pre-College Programs")
-#     exec(open("cps4.py").read())  # Run cps4.py
+render_token_budget()
+if st.secrets.get("ledger_admin"):
+    render_ledger_panel()
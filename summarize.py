@@ -0,0 +1,69 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from chat_memory import get_chat_encoding
+from ingestion import chunk_pages
+
+# Documents up to this many tokens are summarized in one prompt, as before
+DOCUMENT_TOKEN_BUDGET = 12000
+
+# Map step: chunk size, overlap, and how many chunks are summarized at the same time
+MAP_CHUNK_TOKENS = 3000
+MAP_CHUNK_OVERLAP = 100
+MAX_PARALLEL_CHUNKS = 4
+
+# Reduce step: stop condensing after this many rounds and cut whatever is left
+MAX_ROUNDS = 3
+
+MAP_PROMPT = (
+    "The text below is part {part} of {parts} of a longer document. "
+    "Summarize it in at most 300 words. Keep every fact, name, number and date "
+    "that someone could ask about, and leave out navigation text and repetition.\n\n{text}"
+)
+
+
+# Function to summarize every chunk of a text in parallel (the map step)
+def summarize_chunks(text, complete, chunk_tokens=MAP_CHUNK_TOKENS, overlap=MAP_CHUNK_OVERLAP,
+                     max_workers=MAX_PARALLEL_CHUNKS):
+    """Return one partial summary per chunk of text, in document order.
+
+    complete(prompt) sends one prompt to the LLM and returns its answer.
+    At most max_workers prompts are in flight at once, so a long document
+    takes about one chunk's latency per max_workers chunks.
+    """
+    chunks = [chunk["text"] for chunk in chunk_pages([text], chunk_tokens, overlap)]
+    prompts = [MAP_PROMPT.format(part=i, parts=len(chunks), text=chunk) for i, chunk in enumerate(chunks, start=1)]
+    if len(prompts) == 1:
+        return [complete(prompts[0])]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(prompts)), thread_name_prefix="summarize") as pool:
+        return list(pool.map(complete, prompts))
+
+# Function to shrink a document until it fits in one summary prompt (map-reduce)
+def condense_document(document, complete, budget_tokens=DOCUMENT_TOKEN_BUDGET, **map_options):
+    """Return (text, report) where text fits in budget_tokens.
+
+    Documents that already fit are returned unchanged. Longer ones are split
+    into chunks, each chunk is summarized (map), and the partial summaries are
+    joined in order (reduce); if the result is still too long the process
+    repeats on it. The caller then builds its usual summary prompt around the
+    condensed text, so summary type, language and question work as before.
+    """
+    # Budgets are in the chat model's tokens. The document is encoded directly, since count_tokens'
+    # cache would keep whole pages in memory
+    encoding = get_chat_encoding()
+    text = document
+    tokens = len(encoding.encode(text))
+    report = {"tokens_in": tokens, "tokens_out": tokens, "chunks": 0, "rounds": 0, "truncated": False}
+    while tokens > budget_tokens and report["rounds"] < MAX_ROUNDS:
+        partial_summaries = summarize_chunks(text, complete, **map_options)
+        report["chunks"] += len(partial_summaries)
+        report["rounds"] += 1
+        text = "\n\n".join(summary.strip() for summary in partial_summaries)
+        tokens = len(encoding.encode(text))
+
+    if tokens > budget_tokens:
+        # Summaries that stopped shrinking are cut rather than overflowing the prompt
+        text = encoding.decode(encoding.encode(text)[:budget_tokens])
+        tokens = budget_tokens
+        report["truncated"] = True
+    report["tokens_out"] = tokens
+    return text, report
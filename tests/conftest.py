@@ -0,0 +1,47 @@
+import os
+import re
+import sys
+
+import pytest
+
+# The app's modules live in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chat_memory
+import embeddings
+import ingestion
+
+
+class FakeEncoding:
+    """Stand-in for a tiktoken encoding: one token per word (with its leading whitespace).
+
+    tiktoken downloads its vocabularies on first use, which the tests must
+    not depend on.
+    """
+
+    def __init__(self):
+        self.vocab = {}
+        self.words = []
+
+    def encode(self, text):
+        tokens = []
+        for word in re.findall(r"\s*\S+|\s+", text):
+            if word not in self.vocab:
+                self.vocab[word] = len(self.words)
+                self.words.append(word)
+            tokens.append(self.vocab[word])
+        return tokens
+
+    def decode(self, tokens):
+        return "".join(self.words[token] for token in tokens)
+
+
+@pytest.fixture(autouse=True)
+def fake_encoding(monkeypatch):
+    encoding = FakeEncoding()
+    monkeypatch.setattr(embeddings, "get_encoding", lambda: encoding)
+    monkeypatch.setattr(ingestion, "get_encoding", lambda: encoding)
+    monkeypatch.setattr(chat_memory, "get_chat_encoding", lambda model=chat_memory.MEMORY_MODEL: encoding)
+    chat_memory.count_tokens.cache_clear()
+    yield encoding
+    chat_memory.count_tokens.cache_clear()
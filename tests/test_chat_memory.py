@@ -0,0 +1,74 @@
+from chat_memory import RollingSummary, TokenBuffer
+
+
+def message(words, role="user"):
+    return {"role": role, "content": " ".join(["word"] * words)}
+
+
+def test_token_buffer_keeps_a_running_total():
+    buffer = TokenBuffer([message(3), message(4)])
+    assert len(buffer) == 2
+    assert buffer.total_tokens == 7
+    buffer.append(message(5))
+    assert buffer.total_tokens == 12
+    assert buffer.popleft() == message(3)
+    assert buffer.total_tokens == 9
+
+
+def test_trim_drops_the_oldest_but_keeps_one():
+    buffer = TokenBuffer([message(3), message(4), message(5)])
+    buffer.trim(9)
+    assert list(buffer) == [message(4), message(5)]
+    assert buffer.total_tokens == 9
+    buffer.trim(1)
+    assert list(buffer) == [message(5)]
+    assert buffer.total_tokens == 5
+
+
+def test_tail_does_not_change_the_buffer():
+    buffer = TokenBuffer([message(3), message(4), message(5)])
+    assert buffer.tail(9) == [message(4), message(5)]
+    assert buffer.tail(8) == [message(5)]
+    assert buffer.tail(0) == [message(5)]  # always at least the newest message
+    assert len(buffer) == 3
+    assert buffer.total_tokens == 12
+
+
+def test_rolling_summary_refreshes_once_enough_is_pending():
+    summary = RollingSummary(trigger_tokens=10)
+    messages = [message(4), message(4, "assistant")]
+    assert summary.pending(messages) == messages
+    assert not summary.should_refresh(messages)
+
+    messages.append(message(4))
+    assert summary.should_refresh(messages)
+    calls = []
+
+    def summarize(previous, new_messages):
+        calls.append((previous, new_messages))
+        return "summary one"
+
+    summary.refresh_in_background(summarize, messages).join()
+    assert calls == [("", messages)]
+    assert summary.text == "summary one"
+    assert summary.pending(messages) == []
+
+    # Only the turns added since are sent, along with the summary so far
+    messages += [message(6, "assistant"), message(6)]
+    assert summary.should_refresh(messages)
+    summary.refresh_in_background(summarize, messages).join()
+    assert calls[1] == ("summary one", messages[3:])
+
+
+def test_rolling_summary_keeps_the_old_text_when_the_update_fails():
+    summary = RollingSummary(trigger_tokens=1)
+    summary.text = "earlier"
+    messages = [message(2)]
+
+    def summarize(previous, new_messages):
+        raise RuntimeError("provider down")
+
+    summary.refresh_in_background(summarize, messages).join()
+    assert summary.text == "earlier"
+    assert summary.last_error == "provider down"
+    assert summary.pending(messages) == messages
@@ -0,0 +1,59 @@
+import pytest
+
+from history_store import ChatMessage, HistoryStore, to_message
+
+
+def make_store(tmp_path, count, max_in_memory=3):
+    store = HistoryStore(max_in_memory=max_in_memory, directory=str(tmp_path))
+    for i in range(count):
+        store.append({"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i}"})
+    return store
+
+
+def contents(messages):
+    return [message.content for message in messages]
+
+
+def test_older_messages_spill_to_disk(tmp_path):
+    store = make_store(tmp_path, 10)
+    assert len(store) == 10
+    assert store.spilled == 7
+    assert len(store._recent) == 3
+
+
+def test_indexing_reads_disk_and_memory(tmp_path):
+    store = make_store(tmp_path, 10)
+    assert store[0] == ChatMessage("user", "message 0")
+    assert store[6].content == "message 6"  # last spilled message
+    assert store[7].content == "message 7"  # first one in memory
+    assert store[-1]["content"] == "message 9"
+    assert store[-10].content == "message 0"
+    with pytest.raises(IndexError):
+        store[10]
+    with pytest.raises(IndexError):
+        store[-11]
+
+
+def test_slices_match_a_list(tmp_path):
+    store = make_store(tmp_path, 10)
+    expected = [f"message {i}" for i in range(10)]
+    for start, stop in [(None, None), (0, 7), (2, 5), (5, 9), (7, None), (-4, None), (-20, 3), (8, 3), (3, 3)]:
+        assert contents(store[start:stop]) == expected[start:stop]
+    with pytest.raises(ValueError):
+        store[::2]
+
+
+def test_unicode_and_newlines_survive_the_spill(tmp_path):
+    store = HistoryStore(max_in_memory=1, directory=str(tmp_path))
+    store.append({"role": "user", "content": "line one\nline two – café"})
+    store.append({"role": "assistant", "content": "ok"})
+    assert store.spilled == 1
+    assert store[0].content == "line one\nline two – café"
+    assert contents(store[:]) == ["line one\nline two – café", "ok"]
+
+
+def test_old_message_formats_are_converted():
+    assert to_message(("You", "hi")) == ChatMessage("user", "hi")
+    assert to_message(("Bot", "hello")) == ChatMessage("assistant", "hello")
+    assert to_message({"role": "model", "parts": [{"text": "hey"}]}) == ChatMessage("model", "hey")
+    assert to_message({"role": "user", "content": "x"}).as_dict() == {"role": "user", "content": "x"}
@@ -0,0 +1,195 @@
+import functools
+import hashlib
+import os
+import random
+import types
+
+import pytest
+
+import ingestion
+import pdf_extract
+from retrievers import NumpyVectorStore
+
+fitz = pytest.importorskip("fitz")
+
+
+class FakeEmbeddings:
+    """embeddings.create() with a deterministic vector per text."""
+
+    def __init__(self):
+        self.requests = 0
+
+    def create(self, input, model):
+        self.requests += 1
+        data = []
+        for index, text in enumerate(input):
+            rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+            data.append(types.SimpleNamespace(index=index, embedding=[rng.uniform(-1, 1) for _ in range(8)]))
+        return types.SimpleNamespace(data=data)
+
+
+class FakeOpenAI:
+    def __init__(self):
+        self.embeddings = FakeEmbeddings()
+
+    def with_options(self, **options):
+        return self
+
+
+def write_pdf(path, lines):
+    document = fitz.open()
+    document.new_page().insert_text((72, 72), "\n".join(lines))
+    document.save(path)
+    document.close()
+
+
+def filenames(store):
+    return sorted({metadata["filename"] for metadata in store.get()["metadatas"]})
+
+
+@pytest.fixture
+def setup(tmp_path, monkeypatch):
+    pdf_dir = tmp_path / "pdfs"
+    pdf_dir.mkdir()
+    # Keep extracted text out of the repository's .pdf_text_cache
+    monkeypatch.setattr(ingestion, "extract_pages",
+                        functools.partial(pdf_extract.extract_pages, cache_dir=str(tmp_path / "text_cache")))
+    store = NumpyVectorStore(str(tmp_path / "index"))
+    client = FakeOpenAI()
+    manifest_path = str(tmp_path / "manifest.json")
+
+    def sync():
+        return ingestion.sync_pdf_directory(store, client, str(pdf_dir), manifest_path)
+
+    return types.SimpleNamespace(pdf_dir=pdf_dir, store=store, client=client, manifest_path=manifest_path, sync=sync)
+
+
+def test_unchanged_files_are_skipped(setup):
+    write_pdf(setup.pdf_dir / "a.pdf", ["Move-in day is Sunday.", "Bring your ID card."])
+    write_pdf(setup.pdf_dir / "b.pdf", ["Quiet hours start at 11 pm."])
+
+    report = setup.sync()
+    assert report["indexed"] == ["a.pdf", "b.pdf"]
+    assert report["errors"] == []
+    assert filenames(setup.store) == ["a.pdf", "b.pdf"]
+    assert ingestion.describe_embedding(report["embedding"]).startswith("Embedded 2 chunks")
+    requests = setup.client.embeddings.requests
+
+    report = setup.sync()
+    assert report["indexed"] == []
+    assert report["skipped"] == ["a.pdf", "b.pdf"]
+    assert setup.client.embeddings.requests == requests
+    assert ingestion.describe_embedding(report["embedding"]) is None
+
+
+def test_changed_file_replaces_its_vectors(setup):
+    write_pdf(setup.pdf_dir / "a.pdf", ["Move-in day is Sunday."])
+    write_pdf(setup.pdf_dir / "b.pdf", ["Quiet hours start at 11 pm."])
+    first = setup.sync()
+
+    write_pdf(setup.pdf_dir / "a.pdf", ["Move-in day is Saturday."])
+    report = setup.sync()
+    assert report["indexed"] == ["a.pdf"]
+    assert report["skipped"] == ["b.pdf"]
+    assert report["corpus_hash"] != first["corpus_hash"]
+    documents = setup.store.get()["documents"]
+    assert any("Saturday" in text for text in documents)
+    assert not any("Sunday" in text for text in documents)
+
+
+def test_deleted_file_is_purged(setup):
+    write_pdf(setup.pdf_dir / "a.pdf", ["Move-in day is Sunday."])
+    write_pdf(setup.pdf_dir / "b.pdf", ["Quiet hours start at 11 pm."])
+    setup.sync()
+
+    os.remove(setup.pdf_dir / "b.pdf")
+    report = setup.sync()
+    assert report["removed"] == ["b.pdf"]
+    assert filenames(setup.store) == ["a.pdf"]
+    assert "b.pdf" not in ingestion.load_manifest(setup.manifest_path)["files"]
+
+
+def test_wiped_collection_is_reindexed(setup):
+    write_pdf(setup.pdf_dir / "a.pdf", ["Move-in day is Sunday."])
+    setup.sync()
+
+    setup.store.delete(where={"filename": "a.pdf"})
+    report = setup.sync()
+    assert report["indexed"] == ["a.pdf"]
+    assert filenames(setup.store) == ["a.pdf"]
+
+
+def test_errored_file_is_retried_after_its_backoff(setup, monkeypatch):
+    write_pdf(setup.pdf_dir / "a.pdf", ["Move-in day is Sunday."])
+    (setup.pdf_dir / "broken.pdf").write_bytes(b"not a pdf")
+
+    report = setup.sync()
+    assert report["indexed"] == ["a.pdf"]
+    assert [filename for filename, _ in report["errors"]] == ["broken.pdf"]
+    failure = ingestion.load_manifest(setup.manifest_path)["failed"]["broken.pdf"]
+    assert failure["attempts"] == 1
+    assert report["retry_at"] == ingestion.retry_at(failure)
+
+    # Before the backoff has passed the file is not opened again, but its error is still reported
+    report = setup.sync()
+    assert report["deferred"] == ["broken.pdf"]
+    assert [filename for filename, _ in report["errors"]] == ["broken.pdf"]
+    assert report["skipped"] == ["a.pdf"]
+
+    now = report["retry_at"] + 1
+    monkeypatch.setattr(ingestion.time, "time", lambda: now)
+    report = setup.sync()
+    assert report["deferred"] == []
+    assert ingestion.load_manifest(setup.manifest_path)["failed"]["broken.pdf"]["attempts"] == 2
+
+    # Fixing the file indexes it and clears the failure
+    write_pdf(setup.pdf_dir / "broken.pdf", ["Laundry is in the basement."])
+    report = setup.sync()
+    assert report["indexed"] == ["broken.pdf"]
+    assert report["retry_at"] is None
+    assert ingestion.load_manifest(setup.manifest_path)["failed"] == {}
+    assert filenames(setup.store) == ["a.pdf", "broken.pdf"]
+
+
+def test_failed_reindex_keeps_the_old_version_until_the_file_is_deleted(setup):
+    write_pdf(setup.pdf_dir / "a.pdf", ["Move-in day is Sunday."])
+    write_pdf(setup.pdf_dir / "b.pdf", ["Quiet hours start at 11 pm."])
+    first = setup.sync()
+
+    (setup.pdf_dir / "a.pdf").write_bytes(b"not a pdf")
+    report = setup.sync()
+    assert [filename for filename, _ in report["errors"]] == ["a.pdf"]
+    assert report["corpus_hash"] == first["corpus_hash"]
+    assert filenames(setup.store) == ["a.pdf", "b.pdf"]
+
+    os.remove(setup.pdf_dir / "a.pdf")
+    report = setup.sync()
+    assert report["removed"] == ["a.pdf"]
+    assert filenames(setup.store) == ["b.pdf"]
+    manifest = ingestion.load_manifest(setup.manifest_path)
+    assert "a.pdf" not in manifest["files"] and manifest["failed"] == {}
+
+
+def test_failed_store_leaves_no_partial_vectors(setup, monkeypatch):
+    write_pdf(setup.pdf_dir / "a.pdf", ["Move-in day is Sunday."])
+    write_pdf(setup.pdf_dir / "b.pdf", ["Quiet hours start at 11 pm."])
+    setup.sync()
+
+    # The new version's vectors are half written when the store fails
+    write_pdf(setup.pdf_dir / "a.pdf", ["Move-in day is Saturday."])
+    store_pdf_chunks = ingestion.store_pdf_chunks
+
+    def failing_store(collection, filename, chunks, embeddings):
+        store_pdf_chunks(collection, filename, chunks, embeddings)
+        raise OSError("disk full")
+
+    monkeypatch.setattr(ingestion, "store_pdf_chunks", failing_store)
+    report = setup.sync()
+    assert [filename for filename, _ in report["errors"]] == ["a.pdf"]
+    assert filenames(setup.store) == ["b.pdf"]
+
+    monkeypatch.setattr(ingestion, "store_pdf_chunks", store_pdf_chunks)
+    os.remove(setup.pdf_dir / "a.pdf")
+    setup.sync()
+    assert filenames(setup.store) == ["b.pdf"]
+    assert ingestion.load_manifest(setup.manifest_path)["failed"] == {}
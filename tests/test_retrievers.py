@@ -0,0 +1,59 @@
+import json
+import os
+
+from retrievers import RECORDS_FILENAME, NumpyVectorStore
+
+
+def add(store, ids, embeddings, filename="a.pdf"):
+    store.add(
+        documents=[f"text of {id_}" for id_ in ids],
+        metadatas=[{"filename": filename, "chunk": i} for i in range(len(ids))],
+        ids=ids,
+        embeddings=embeddings,
+    )
+
+
+def test_search_returns_nearest_first(tmp_path):
+    store = NumpyVectorStore(str(tmp_path))
+    add(store, ["x", "y", "z"], [[1, 0, 0], [0, 1, 0], [0, 0, 1]])
+    hits = store.search([0.1, 0.9, 0], k=2)
+    assert [hit["id"] for hit in hits] == ["y", "x"]
+    assert hits[0]["text"] == "text of y"
+    assert hits[0]["metadata"] == {"filename": "a.pdf", "chunk": 1}
+
+
+def test_add_replaces_existing_ids_and_delete_by_filename(tmp_path):
+    store = NumpyVectorStore(str(tmp_path))
+    add(store, ["a::0", "a::1"], [[1, 0], [0, 1]], filename="a.pdf")
+    add(store, ["b::0"], [[1, 1]], filename="b.pdf")
+    add(store, ["a::0"], [[0, 1]], filename="a.pdf")
+    assert store.count() == 3
+    assert store.search([0, 1], k=1)[0]["id"] in ("a::0", "a::1")
+
+    store.delete(where={"filename": "a.pdf"})
+    assert store.get()["ids"] == ["b::0"]
+
+
+def test_reload_keeps_only_the_latest_snapshot(tmp_path):
+    store = NumpyVectorStore(str(tmp_path))
+    add(store, ["x"], [[1, 0]])
+    add(store, ["y"], [[0, 1]])
+    assert [name for name in os.listdir(tmp_path) if name.endswith(".f32")] == ["embeddings-2.f32"]
+
+    reloaded = NumpyVectorStore(str(tmp_path))
+    assert reloaded.get()["ids"] == ["x", "y"]
+    assert reloaded.search([0, 1], k=1)[0]["id"] == "y"
+
+
+def test_inconsistent_embeddings_file_starts_empty(tmp_path):
+    store = NumpyVectorStore(str(tmp_path))
+    add(store, ["x", "y"], [[1, 0], [0, 1]])
+    with open(tmp_path / RECORDS_FILENAME, encoding="utf-8") as file:
+        embeddings_file = json.load(file)["embeddings_file"]
+    with open(tmp_path / embeddings_file, "r+b") as file:
+        file.truncate(8)
+
+    reloaded = NumpyVectorStore(str(tmp_path))
+    assert reloaded.count() == 0
+    assert reloaded.search([1, 0]) == []
+
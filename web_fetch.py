@@ -0,0 +1,176 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import metrics
+from html_extract import default_parser, extract
+
+WEB_CACHE_DIRECTORY = os.path.join(os.getcwd(), ".web_cache")
+
+# Pages fetched within this many seconds are served without touching the network
+FETCH_TTL_SECONDS = 15 * 60
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 10
+MEMORY_CACHE_ENTRIES = 256
+
+# Concurrent fetching: worker threads and the total time allowed per URL
+MAX_FETCH_WORKERS = 8
+URL_DEADLINE_SECONDS = 15
+
+_session = None
+_session_lock = threading.Lock()
+_memory_cache = OrderedDict()  # cache key -> entry dict
+_memory_lock = threading.Lock()
+
+
+# Function to turn a page into the text of its <p> tags (used by cps3)
+def paragraph_text(html):
+    return extract(html, mode="paragraphs")
+
+# Function to turn a page into its text without scripts, menus and footers (used by cps2)
+def page_text(html):
+    return extract(html, mode="text")
+
+EXTRACTORS = {
+    "paragraphs": paragraph_text,
+    "page": page_text,
+}
+
+
+def get_session():
+    """Return the process-wide requests.Session with pooled, keep-alive connections."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            retry = Retry(total=2, backoff_factor=0.3, status_forcelist=(502, 503, 504), allowed_methods=("GET",))
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=retry)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+def _cache_key(url, extractor):
+    # The parser is part of the key, since each one may split text slightly differently
+    return hashlib.sha256(f"{extractor}\n{default_parser()}\n{url}".encode("utf-8")).hexdigest()
+
+def _load_entry(key, cache_dir):
+    with _memory_lock:
+        entry = _memory_cache.get(key)
+        if entry is not None:
+            _memory_cache.move_to_end(key)
+            return entry
+    if cache_dir is None:
+        return None
+    try:
+        with open(os.path.join(cache_dir, f"{key}.json"), "r", encoding="utf-8") as file:
+            entry = json.load(file)
+    except (OSError, ValueError):
+        return None
+    _remember(key, entry)
+    return entry
+
+def _remember(key, entry):
+    with _memory_lock:
+        _memory_cache[key] = entry
+        _memory_cache.move_to_end(key)
+        while len(_memory_cache) > MEMORY_CACHE_ENTRIES:
+            _memory_cache.popitem(last=False)
+
+def _save_entry(key, entry, cache_dir):
+    _remember(key, entry)
+    if cache_dir is None:
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"{key}.json")
+    tmp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(entry, file)
+    os.replace(tmp_path, path)
+
+# Function to fetch a web page's text, reusing cached text whenever the page is unchanged
+def fetch_text(url, extractor="paragraphs", ttl=FETCH_TTL_SECONDS,
+               timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), cache_dir=WEB_CACHE_DIRECTORY):
+    """Return the extracted text of url.
+
+    Text fetched less than ttl seconds ago comes straight from the cache.
+    Older entries are revalidated with If-None-Match / If-Modified-Since, and
+    a 304 reply reuses the cached text. Raises requests.RequestException on
+    network or HTTP errors.
+    """
+    key = _cache_key(url, extractor)
+    entry = _load_entry(key, cache_dir)
+    now = time.time()
+    if entry is not None and now - entry["checked_at"] < ttl:
+        return entry["text"]
+
+    headers = {}
+    if entry is not None:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    with metrics.span("fetch.url", revalidate=entry is not None):
+        response = get_session().get(url, headers=headers, timeout=timeout)
+    if response.status_code == 304 and entry is not None:
+        entry = dict(entry, checked_at=now)
+        _save_entry(key, entry, cache_dir)
+        return entry["text"]
+    response.raise_for_status()
+
+    entry = {
+        "url": url,
+        "extractor": extractor,
+        "text": EXTRACTORS[extractor](response.content),
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "checked_at": now,
+    }
+    _save_entry(key, entry, cache_dir)
+    return entry["text"]
+
+
+# Outcome of fetching one URL: text is None and error is set when it failed
+FetchResult = namedtuple("FetchResult", ["url", "text", "error"])
+
+# Function to fetch several pages at once, so the wait tracks the slowest page instead of the sum
+def fetch_many(urls, extractor="paragraphs", max_workers=MAX_FETCH_WORKERS,
+               deadline=URL_DEADLINE_SECONDS, **fetch_kwargs):
+    """Fetch urls concurrently and return one FetchResult per URL, in input order.
+
+    Each URL gets its own connect/read timeouts (see fetch_text) and at most
+    `deadline` seconds overall. Failures are reported per URL instead of
+    aborting the batch. Repeated URLs are fetched once.
+    """
+    unique_urls = list(dict.fromkeys(urls))
+    if not unique_urls:
+        return []
+
+    pool = ThreadPoolExecutor(max_workers=min(max_workers, len(unique_urls)), thread_name_prefix="fetch")
+    started = time.monotonic()
+    futures = {url: pool.submit(fetch_text, url, extractor, **fetch_kwargs) for url in unique_urls}
+    outcomes = {}
+    try:
+        for url, future in futures.items():
+            remaining = max(0.0, deadline - (time.monotonic() - started))
+            try:
+                outcomes[url] = FetchResult(url, future.result(timeout=remaining), None)
+            except FutureTimeoutError:
+                outcomes[url] = FetchResult(url, None, TimeoutError(f"No response within {deadline} seconds"))
+            except Exception as e:
+                outcomes[url] = FetchResult(url, None, e)
+    finally:
+        # Do not wait for stragglers that missed their deadline
+        pool.shutdown(wait=False, cancel_futures=True)
+    metrics.observe("fetch.batch", time.monotonic() - started)
+    return [outcomes[url] for url in urls]